@@ -0,0 +1,107 @@
+"""Database throughput of Pinterest checks: connection per call vs the pool.
+
+Replays the database side of a Pinterest check (read the last snapshot and
+the stored boards, update every board, add an event, store the new
+snapshot) against a fresh database file, once per mode:
+
+  baseline  a new connection per helper call, default journal (the old get_db)
+  pooled    the pooled WAL connections get_db() uses now
+
+Every helper runs in its own transaction, the way monitors called them
+before check sessions batched their writes.
+
+    python bench/db_checks.py [--checks 300] [--boards 30] | tee bench_output.txt
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "recoral"))
+
+import database as db  # noqa: E402
+
+_pooled_get_db = db.get_db
+
+
+@contextmanager
+def _baseline_get_db():
+    """get_db() before pooling: connect, work, commit, close."""
+    conn = sqlite3.connect(db.DATABASE_NAME)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _setup(accounts, boards):
+    db.init_db()
+    identity = db.add_identity("bench")
+    ids = []
+    for i in range(accounts):
+        account_id = db.add_account(identity, "pinterest", f"user{i}")
+        for b in range(boards):
+            db.add_pinterest_board(account_id, f"https://www.pinterest.com/user{i}/board{b}/",
+                                   f"Board {b}", 0, "description")
+        db.record_check_success(account_id, {"boards": [], "user": None})
+        ids.append(account_id)
+    return ids
+
+
+def _check(account_id, n):
+    """One Pinterest check's worth of database calls."""
+    old = db.get_last_data(account_id)
+    boards = db.get_pinterest_boards(account_id)
+    for board in boards:
+        db.update_pinterest_board(board["id"], board["current_pin_count"] + 1, board["name"], board["description"])
+    db.add_event(account_id, "new_pins", f"+1 pin(s) on {len(boards)} boards", {"check": n})
+    db.record_check_success(account_id, {"boards": [b["url"] for b in boards], "user": old.get("user")})
+
+
+def run(mode, path, checks, accounts, boards):
+    db.get_db = _baseline_get_db if mode == "baseline" else _pooled_get_db
+    db.DATABASE_NAME = str(path)
+    ids = _setup(accounts, boards)
+    started = time.perf_counter()
+    for n in range(checks):
+        _check(ids[n % len(ids)], n)
+    elapsed = time.perf_counter() - started
+    journal = sqlite3.connect(path).execute("PRAGMA journal_mode").fetchone()[0]
+    db.close_pool()
+    return checks / elapsed, journal
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--checks", type=int, default=300)
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--boards", type=int, default=30)
+    parser.add_argument("--dir", help="where to create the database files (default: a temp dir)")
+    args = parser.parse_args()
+
+    tmp = Path(args.dir or tempfile.mkdtemp(prefix="coral-bench-"))
+    print(f"{args.checks} checks, {args.accounts} accounts x {args.boards} boards, databases in {tmp}")
+    rates = {}
+    for mode in ("baseline", "pooled"):
+        path = tmp / f"{mode}.db"
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(f"{path}{suffix}"):
+                os.remove(f"{path}{suffix}")
+        rates[mode], journal = run(mode, path, args.checks, args.accounts, args.boards)
+        print(f"  {mode:<9} {rates[mode]:8.1f} checks/s  (journal {journal})")
+    print(f"  speedup   {rates['pooled'] / rates['baseline']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Check that sharded workers never run the same account twice at once.
+
+Starts N ``python -m recoral worker`` processes in sharded mode against one
+temporary database, with every monitor swapped for a stub that sleeps and
+logs when each check starts and ends. While they run, every account is made
+due again every couple of seconds, so the workers keep racing for the same
+claims. Exits non-zero if any account's checks overlap, or if a worker dies.
+
+    python bench/shard_check.py [--workers 4] [--accounts 60] [--seconds 20]
+"""
+import argparse
+import json
+import os
+import random
+import runpy
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "recoral"))
+
+PLATFORMS = ("pinterest", "spotify", "instagram")
+
+
+def _log_check(log, acc, started):
+    line = json.dumps({"account": acc["id"], "pid": os.getpid(), "start": started, "end": time.time()})
+    with open(log, "a") as f:
+        f.write(line + "\n")
+
+
+class AsyncStub:
+    """Stands in for the aiohttp monitors: sleeps on the loop."""
+
+    def __init__(self, log):
+        self.log = log
+
+    async def check(self, acc, session):
+        import asyncio
+        started = time.time()
+        await asyncio.sleep(random.uniform(0.05, 0.5))
+        session.record_check_success(acc["id"], {"n": random.random()})
+        _log_check(self.log, acc, started)
+
+
+class SyncStub:
+    """Stands in for the Instagram monitor: blocks a pool thread."""
+
+    def __init__(self, log):
+        self.log = log
+
+    def check(self, acc, session):
+        started = time.time()
+        time.sleep(random.uniform(0.05, 0.5))
+        session.record_check_success(acc["id"], {"n": random.random()})
+        _log_check(self.log, acc, started)
+
+
+def child(log):
+    """Run ``python -m recoral worker`` with the stub monitors installed."""
+    import scheduler
+    scheduler.PinterestMonitor = lambda: AsyncStub(log)
+    scheduler.SpotifyMonitor = lambda: AsyncStub(log)
+    scheduler.InstagramMonitor = lambda: SyncStub(log)
+    sys.argv = ["recoral", "worker"]
+    sys.path.insert(0, str(ROOT))
+    runpy.run_module("recoral", run_name="__main__", alter_sys=True)
+
+
+def overlaps(checks):
+    """(account, earlier, later) for every pair of checks of one account that overlap."""
+    by_account = {}
+    for c in checks:
+        by_account.setdefault(c["account"], []).append(c)
+    found = []
+    for account, runs in sorted(by_account.items()):
+        runs.sort(key=lambda c: c["start"])
+        for earlier, later in zip(runs, runs[1:]):
+            if later["start"] < earlier["end"]:
+                found.append((account, earlier, later))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--accounts", type=int, default=60)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--redue", type=float, default=2, help="seconds between making every account due again")
+    parser.add_argument("--child", metavar="LOG", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child)
+
+    tmp = Path(tempfile.mkdtemp(prefix="coral-shards-"))
+    env = dict(os.environ,
+               CORAL_DB=str(tmp / "coral.db"),
+               CORAL_SHARDED="true",
+               CORAL_DISPATCH_TICK="1",
+               CORAL_QUEUE_RESYNC="2",
+               CORAL_LEADER_HEARTBEAT="1",
+               CORAL_LEADER_TTL="3",
+               CORAL_CLAIM_BATCH="5",
+               CORAL_PINTEREST_WORKERS="4",
+               CORAL_SPOTIFY_WORKERS="4",
+               CORAL_METRICS_PORT="0",
+               CORAL_JOB_POLL="60")
+    os.environ.update(env)
+    import database as db
+
+    db.init_db()
+    identity = db.add_identity("shard-check")
+    ids = [db.add_account(identity, PLATFORMS[i % len(PLATFORMS)], f"user{i}") for i in range(args.accounts)]
+
+    workers = []
+    for i in range(args.workers):
+        out = open(tmp / f"worker{i}.out", "w")
+        workers.append(subprocess.Popen(
+            [sys.executable, __file__, "--child", str(tmp / f"checks{i}.jsonl")],
+            env=env, cwd=ROOT, stdout=out, stderr=subprocess.STDOUT))
+    print(f"{args.workers} workers, {args.accounts} accounts, {args.seconds:g}s in {tmp}")
+
+    deadline = time.monotonic() + args.seconds
+    while time.monotonic() < deadline:
+        time.sleep(args.redue)
+        now = time.time()
+        db.set_next_checks([(account_id, now) for account_id in ids])
+
+    crashed = [i for i, w in enumerate(workers) if w.poll() is not None]
+    for w in workers:
+        w.send_signal(signal.SIGTERM)
+    for w in workers:
+        try:
+            w.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            w.kill()
+
+    checks = []
+    for i in range(args.workers):
+        log = tmp / f"checks{i}.jsonl"
+        runs = [json.loads(line) for line in log.read_text().splitlines()] if log.exists() else []
+        print(f"  worker {i}: {len(runs)} checks")
+        checks.extend(runs)
+    found = overlaps(checks)
+    checked = len({c["account"] for c in checks})
+    print(f"{len(checks)} checks of {checked}/{args.accounts} accounts, {len(found)} overlapping")
+    for account, earlier, later in found[:10]:
+        print(f"  account {account}: pid {earlier['pid']} {earlier['start']:.3f}-{earlier['end']:.3f}"
+              f" overlaps pid {later['pid']} {later['start']:.3f}-{later['end']:.3f}")
+    if crashed:
+        print(f"worker(s) {crashed} exited early; see {tmp}")
+    return 1 if found or crashed or not checks else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Command-line entry point: python -m recoral [all|web|worker]
+
+  all     serve the UI and run checks in one process (default)
+  web     serve the UI only; manual checks are queued for a worker
+  worker  run the scheduler and monitors only
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+
+logger = logging.getLogger("coral")
+
+
+def run_worker():
+    import database as db
+    from scheduler import CoralScheduler
+
+    db.init_db()
+    if config.METRICS_PORT:
+        import metrics
+        metrics.serve(config.HOST, config.METRICS_PORT)
+        logger.info("Metrics on http://%s:%d/metrics", config.HOST, config.METRICS_PORT)
+    scheduler = CoralScheduler(check_interval=config.CHECK_INTERVAL)
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    scheduler.start()
+    logger.info("CORAL worker running (pid %d)", os.getpid())
+    stop.wait()
+    logger.info("CORAL worker stopping")
+    scheduler.stop()
+
+
+def run_web():
+    import app
+    app.main()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m recoral", description="CORAL")
+    parser.add_argument("role", nargs="?", choices=("all", "web", "worker"), default=config.ROLE)
+    args = parser.parse_args(argv)
+    config.ROLE = args.role
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+    if args.role == "worker":
+        run_worker()
+    else:
+        run_web()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,8 @@ from routes.accounts import bp as accounts_bp
 from routes.events import bp as events_bp
 from routes.monitoring import bp as monitoring_bp
 from routes.settings import bp as settings_bp
+from routes.check_runs import bp as check_runs_bp
+from routes.metrics import bp as metrics_bp
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
@@ -34,15 +36,27 @@ app.register_blueprint(accounts_bp)
 app.register_blueprint(events_bp)
 app.register_blueprint(monitoring_bp)
 app.register_blueprint(settings_bp)
+app.register_blueprint(check_runs_bp)
+app.register_blueprint(metrics_bp)
 
 # Initialize
 db.init_db()
-scheduler = CoralScheduler(check_interval=config.CHECK_INTERVAL)
+scheduler = None if config.ROLE == "web" else CoralScheduler(check_interval=config.CHECK_INTERVAL)
 app.config["scheduler"] = scheduler
-
-if __name__ == "__main__":
+# Under a WSGI server (e.g. gunicorn -w 4 app:app) every worker imports this
+# module; their schedulers elect a single leader through the database.
+if scheduler and __name__ != "__main__":
     scheduler.start()
+
+
+def main():
+    if scheduler:
+        scheduler.start()
     print(f"\n{'=' * 50}")
-    print(f"  CORAL running on http://localhost:{config.PORT}")
+    print(f"  CORAL running on http://localhost:{config.PORT} ({config.ROLE})")
     print(f"{'=' * 50}\n")
     app.run(host=config.HOST, port=config.PORT, debug=config.DEBUG, use_reloader=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Circuit breakers for platforms and the credentials used against them.
+
+A breaker opens after ``BREAKER_THRESHOLD`` consecutive platform-level
+failures (rate limiting, expired sessions, auth errors). While open, checks
+that would use it are skipped with ``CircuitOpen`` instead of adding to the
+problem. After the reset timeout a single half-open probe is let through:
+success closes the breaker, failure re-opens it with a doubled timeout.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import config
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# State changes not yet published to the database, newest last; the
+# scheduler drains them into circuit_events for /api/stats
+transitions = deque(maxlen=50)
+
+
+class CircuitOpen(Exception):
+    def __init__(self, circuit):
+        self.circuit = circuit
+        super().__init__(f"{circuit.name} circuit open, retry in {circuit.retry_in():.0f}s")
+
+
+class CircuitBreaker:
+    def __init__(self, name, platform, threshold=None, reset_timeout=None):
+        self.name = name
+        self.platform = platform
+        self.threshold = threshold or config.BREAKER_THRESHOLD
+        self.base_timeout = reset_timeout or config.BREAKER_RESET
+        self.reset_timeout = self.base_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.last_error = None
+        self._opened_at = 0.0
+        self._probe_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self._opened_at < self.reset_timeout:
+                    return False
+                self._transition(HALF_OPEN)
+            # one probe at a time; a probe that never reported back expires
+            if self._probe_at is not None and now - self._probe_at < self.reset_timeout:
+                return False
+            self._probe_at = now
+            return True
+
+    def check(self):
+        """Raise CircuitOpen unless a request may go through."""
+        if not self.allow():
+            raise CircuitOpen(self)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_at = None
+            if self.state != CLOSED:
+                self.reset_timeout = self.base_timeout
+                self._transition(CLOSED)
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            self._probe_at = None
+            if self.state == HALF_OPEN:
+                self.reset_timeout = min(self.reset_timeout * 2, config.BREAKER_MAX_RESET)
+                self._open()
+            elif self.state == CLOSED and self.failures >= self.threshold:
+                self._open()
+
+    def retry_in(self):
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "platform": self.platform,
+            "state": self.state,
+            "failures": self.failures,
+            "error": self.last_error,
+            "retry_in": round(self.retry_in()),
+        }
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._transition(OPEN)
+
+    def _transition(self, state):
+        old, self.state = self.state, state
+        log = logger.warning if state == OPEN else logger.info
+        log("Circuit %s: %s -> %s (%s)", self.name, old, state, self.last_error)
+        transitions.append({
+            "at": datetime.utcnow().isoformat(),
+            "name": self.name,
+            "platform": self.platform,
+            "from": old,
+            "to": state,
+            "error": self.last_error,
+        })
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get(platform, credential=None, secret=False):
+    """Breaker for ``platform`` used with ``credential``.
+
+    Pass ``secret=True`` for credentials that must not appear in names or
+    logs (cookies); they are identified by a short hash instead.
+    """
+    label = ""
+    if credential:
+        label = hashlib.sha256(credential.encode()).hexdigest()[:8] if secret else credential
+    name = f"{platform}:{label}" if label else platform
+    with _lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, platform)
+        return _breakers[name]
+
+
+def drain():
+    """Take the state changes recorded since the last call."""
+    drained = []
+    while transitions:
+        try:
+            drained.append(transitions.popleft())
+        except IndexError:
+            break
+    return drained
+
+
+def alerts():
+    """Snapshots of every breaker that is not closed."""
+    with _lock:
+        breakers = list(_breakers.values())
+    return [b.snapshot() for b in breakers if b.state != CLOSED]
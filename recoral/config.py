@@ -11,9 +11,127 @@ DEBUG = os.getenv("CORAL_DEBUG", "false").lower() == "true"
 CHECK_INTERVAL = int(os.getenv("CORAL_CHECK_INTERVAL", 300))
 SP_DC_COOKIE = os.getenv("SP_DC_COOKIE", "")
 INSTAGRAM_SESSION_FILE = os.getenv("INSTAGRAM_SESSION_FILE", "")
+STATS_CACHE_TTL = float(os.getenv("CORAL_STATS_CACHE_TTL", 5))
+
+# "threaded" runs checks concurrently, "sequential" checks one account at a
+# time. Workers cap the checks in flight per platform: Pinterest and Spotify
+# are async and share one event loop, so they can go much higher than
+# Instagram, whose sync instaloader checks each hold a pool thread. Instagram
+# stays at one worker by default: instaloader contexts are shared per session
+# and Instagram rate limits hard.
+CHECK_MODE = os.getenv("CORAL_CHECK_MODE", "threaded")
+PLATFORM_WORKERS = {
+    "instagram": int(os.getenv("CORAL_INSTAGRAM_WORKERS", 1)),
+    "pinterest": int(os.getenv("CORAL_PINTEREST_WORKERS", 32)),
+    "spotify": int(os.getenv("CORAL_SPOTIFY_WORKERS", 64)),
+}
+
+# Wall-clock budgets in seconds (0 = unlimited). A check's budget starts when
+# it actually begins running and excludes time spent waiting for the
+# platform's rate limit; one that overruns is abandoned and recorded as
+# an error. A cycle that overruns abandons the checks it has not finished and
+# leaves them to the dispatcher.
+CHECK_TIMEOUT = float(os.getenv("CORAL_CHECK_TIMEOUT", 120))
+CYCLE_TIMEOUT = float(os.getenv("CORAL_CYCLE_TIMEOUT", 0))
+
+# Every check stores a check_runs row with per-phase timings; rows older than
+# this many days are pruned hourly.
+CHECK_RUNS_KEEP_DAYS = int(os.getenv("CORAL_CHECK_RUNS_KEEP_DAYS", 7))
+
+# Notifications are written to an outbox and delivered in the background by
+# NOTIFY_WORKERS threads, polling every NOTIFY_POLL seconds when idle. Failed
+# sends back off exponentially from NOTIFY_BACKOFF up to NOTIFY_BACKOFF_MAX
+# seconds and are dropped after NOTIFY_MAX_ATTEMPTS.
+NOTIFY_WORKERS = int(os.getenv("CORAL_NOTIFY_WORKERS", 4))
+NOTIFY_POLL = float(os.getenv("CORAL_NOTIFY_POLL", 5))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("CORAL_NOTIFY_MAX_ATTEMPTS", 8))
+NOTIFY_BACKOFF = float(os.getenv("CORAL_NOTIFY_BACKOFF", 10))
+NOTIFY_BACKOFF_MAX = float(os.getenv("CORAL_NOTIFY_BACKOFF_MAX", 3600))
+
+# Digests: "off" sends every event on its own, "check" sends all events from
+# one check as a single message, "window" collects an account's events for
+# NOTIFY_DIGEST_WINDOW seconds after the first one.
+NOTIFY_DIGEST = os.getenv("CORAL_NOTIFY_DIGEST", "off")
+NOTIFY_DIGEST_WINDOW = float(os.getenv("CORAL_NOTIFY_DIGEST_WINDOW", 60))
+
+# The web app serves /metrics itself; a "worker" process has no web server and
+# serves it on this port instead (0 = off).
+METRICS_PORT = int(os.getenv("CORAL_METRICS_PORT", 0))
 
 _db_name = os.getenv("CORAL_DB", "coral.db")
 _db_path = Path(_db_name)
 if not _db_path.is_absolute():
     _db_path = (Path(__file__).resolve().parent / _db_path).resolve()
 DATABASE_NAME = str(_db_path)
+
+# SQLite connection profile
+DB_POOL_SIZE = int(os.getenv("CORAL_DB_POOL_SIZE", 8))
+DB_JOURNAL_MODE = os.getenv("CORAL_DB_JOURNAL_MODE", "wal")
+DB_SYNCHRONOUS = os.getenv("CORAL_DB_SYNCHRONOUS", "normal")
+DB_BUSY_TIMEOUT = int(os.getenv("CORAL_DB_BUSY_TIMEOUT", 5000))  # ms
+DB_CACHE_SIZE = int(os.getenv("CORAL_DB_CACHE_SIZE", -16000))  # negative = KiB
+DB_STATEMENT_CACHE = int(os.getenv("CORAL_DB_STATEMENT_CACHE", 256))
+
+# Settings are cached in-process; how often (seconds) to check whether another
+# process has changed them (0 = only this process's own writes are seen).
+SETTINGS_POLL = float(os.getenv("CORAL_SETTINGS_POLL", 5))
+
+# Request budget per platform as (requests per second, burst). A rate of 0
+# disables limiting for that platform.
+RATE_LIMITS = {
+    "instagram": (float(os.getenv("CORAL_INSTAGRAM_RATE", 0.5)), int(os.getenv("CORAL_INSTAGRAM_BURST", 2))),
+    "pinterest": (float(os.getenv("CORAL_PINTEREST_RATE", 1.0)), int(os.getenv("CORAL_PINTEREST_BURST", 3))),
+    "spotify": (float(os.getenv("CORAL_SPOTIFY_RATE", 5.0)), int(os.getenv("CORAL_SPOTIFY_BURST", 10))),
+    # Notification destinations; a 429's Retry-After also pauses these
+    "discord": (float(os.getenv("CORAL_DISCORD_RATE", 0.5)), int(os.getenv("CORAL_DISCORD_BURST", 5))),
+    "ntfy": (float(os.getenv("CORAL_NTFY_RATE", 0.2)), int(os.getenv("CORAL_NTFY_BURST", 60))),
+}
+
+# Circuit breakers: consecutive platform-level failures before a breaker
+# opens, and its initial / maximum reset timeout in seconds. Failing accounts
+# back off exponentially with their error_count, up to ERROR_BACKOFF_MAX.
+BREAKER_THRESHOLD = int(os.getenv("CORAL_BREAKER_THRESHOLD", 5))
+BREAKER_RESET = int(os.getenv("CORAL_BREAKER_RESET", 300))
+BREAKER_MAX_RESET = int(os.getenv("CORAL_BREAKER_MAX_RESET", 3600))
+ERROR_BACKOFF_MAX = int(os.getenv("CORAL_ERROR_BACKOFF_MAX", 6 * 3600))
+
+# "interval" checks every account each CHECK_INTERVAL; "adaptive" gives each
+# account its own interval between the bounds below based on how often it
+# changes (accounts flagged hot always use the minimum).
+SCHEDULE_MODE = os.getenv("CORAL_SCHEDULE_MODE", "interval")
+ADAPTIVE_MIN_INTERVAL = int(os.getenv("CORAL_ADAPTIVE_MIN_INTERVAL", CHECK_INTERVAL))
+ADAPTIVE_MAX_INTERVAL = int(os.getenv("CORAL_ADAPTIVE_MAX_INTERVAL", 86400))
+ADAPTIVE_WINDOW = int(os.getenv("CORAL_ADAPTIVE_WINDOW", 7 * 86400))
+ADAPTIVE_BACKOFF = float(os.getenv("CORAL_ADAPTIVE_BACKOFF", 1.5))
+
+# Dispatcher: how often due checks are popped from the queue, how often the
+# queue is rebuilt from the database, +/- fraction of jitter applied to each
+# account's next check, and how overdue checks are spread after a restart.
+DISPATCH_TICK = int(os.getenv("CORAL_DISPATCH_TICK", 5))
+QUEUE_RESYNC = int(os.getenv("CORAL_QUEUE_RESYNC", 30))
+SCHEDULE_JITTER = float(os.getenv("CORAL_SCHEDULE_JITTER", 0.1))
+CATCHUP_GRACE = int(os.getenv("CORAL_CATCHUP_GRACE", 60))
+CATCHUP_WINDOW = int(os.getenv("CORAL_CATCHUP_WINDOW", 300))
+
+# "all" serves the UI and runs checks in one process; "web" only serves and
+# "worker" only checks. Split processes share the database, and manual check
+# requests travel through the jobs table, polled every JOB_POLL seconds and
+# run JOB_WORKERS at a time.
+ROLE = os.getenv("CORAL_ROLE", "all")
+JOB_POLL = float(os.getenv("CORAL_JOB_POLL", 2))
+JOB_WORKERS = int(os.getenv("CORAL_JOB_WORKERS", 2))
+JOB_STALE = int(os.getenv("CORAL_JOB_STALE", 600))  # running jobs silent this long are failed
+
+# Only one process dispatches scheduled checks: the holder of a lease it
+# renews every LEADER_HEARTBEAT seconds. A lease not renewed for LEADER_TTL
+# seconds is taken over by another process.
+LEADER_TTL = float(os.getenv("CORAL_LEADER_TTL", 15))
+LEADER_HEARTBEAT = float(os.getenv("CORAL_LEADER_HEARTBEAT", 5))
+
+# Sharded mode: instead of the leader dispatching everything, every worker
+# claims batches of due accounts (CLAIM_BATCH per tick) under a CLAIM_LEASE
+# second lease, so any number of workers can split the load. The leader
+# still spreads new and overdue accounts over the interval.
+SHARDED = os.getenv("CORAL_SHARDED", "false").lower() == "true"
+CLAIM_BATCH = int(os.getenv("CORAL_CLAIM_BATCH", 50))
+CLAIM_LEASE = float(os.getenv("CORAL_CLAIM_LEASE", 600))
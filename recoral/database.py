@@ -1,23 +1,100 @@
+import asyncio
+import contextvars
+import hashlib
 import sqlite3
 import json
+import queue
+import threading
+import time
 from datetime import datetime
 from contextlib import contextmanager
+from uuid import uuid4
+import config
+import metrics
+import tracing
 from config import DATABASE_NAME
 
+# Connections are pooled and handed to one thread at a time. A thread that
+# re-enters get_db() while it already holds a connection reuses it, so nested
+# helpers run inside the caller's transaction and only the outermost block
+# commits.
+_pool = queue.LifoQueue(maxsize=config.DB_POOL_SIZE)
+_local = threading.local()
 
-@contextmanager
-def get_db():
-    conn = sqlite3.connect(DATABASE_NAME)
+TRANSACTION_SECONDS = metrics.Histogram(
+    "coral_db_transaction_seconds", "Outermost get_db() block duration, connection checkout to commit", ["result"])
+
+
+def _connect():
+    conn = sqlite3.connect(
+        DATABASE_NAME,
+        timeout=config.DB_BUSY_TIMEOUT / 1000,
+        check_same_thread=False,
+        cached_statements=config.DB_STATEMENT_CACHE,
+    )
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA journal_mode = {config.DB_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {config.DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout = {int(config.DB_BUSY_TIMEOUT)}")
+    conn.execute(f"PRAGMA cache_size = {int(config.DB_CACHE_SIZE)}")
+    return conn
+
+
+def _acquire():
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _connect()
+
+
+def _release(conn):
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+def close_pool():
+    """Close every idle pooled connection."""
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            return
+
+
+@contextmanager
+def get_db():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+
+    conn = _acquire()
+    _local.conn = conn
+    _local.on_commit = []
+    started = time.perf_counter()
+    result = "rollback"
     try:
         yield conn
         conn.commit()
+        result = "commit"
     except Exception:
         conn.rollback()
         raise
     finally:
-        conn.close()
+        hooks, _local.on_commit = _local.on_commit, None
+        _local.conn = None
+        _release(conn)
+        TRANSACTION_SECONDS.observe(time.perf_counter() - started, result=result)
+    for fn, args in hooks:
+        fn(*args)
+
+
+def _on_commit(fn, *args):
+    """Call ``fn(*args)`` once the current outermost transaction has committed."""
+    _local.on_commit.append((fn, args))
 
 
 def _migrate(conn):
@@ -28,15 +105,98 @@ def _migrate(conn):
     for col, typedef in [
         ("last_error", "TEXT"),
         ("error_count", "INTEGER DEFAULT 0"),
+        ("last_event_id", "INTEGER"),
+        ("last_event_at", "TIMESTAMP"),
+        ("check_interval", "INTEGER"),
+        ("unchanged_streak", "INTEGER DEFAULT 0"),
+        ("hot", "BOOLEAN DEFAULT 0"),
+        ("next_check_at", "REAL"),
+        ("claimed_by", "TEXT"),
+        ("lease_until", "REAL"),
+        ("last_data_hash", "TEXT"),
     ]:
         if col not in cols:
             c.execute(f"ALTER TABLE accounts ADD COLUMN {col} {typedef}")
+    if "last_data_hash" not in cols:
+        c.execute("SELECT id, last_data FROM accounts WHERE last_data IS NOT NULL")
+        hashes = []
+        for account_id, blob in c.fetchall():
+            try:
+                hashes.append((snapshot_hash(json.loads(blob)), account_id))
+            except (json.JSONDecodeError, TypeError):
+                pass
+        c.executemany("UPDATE accounts SET last_data_hash = ? WHERE id = ?", hashes)
+    backfill = "last_event_id" not in cols
+
+    c.execute("PRAGMA table_info(identities)")
+    cols = {r[1] for r in c.fetchall()}
+    for col, typedef in [
+        ("last_event_id", "INTEGER"),
+        ("last_event_at", "TIMESTAMP"),
+    ]:
+        if col not in cols:
+            c.execute(f"ALTER TABLE identities ADD COLUMN {col} {typedef}")
+    backfill = backfill or "last_event_id" not in cols
 
     c.execute("PRAGMA table_info(pinterest_boards)")
     cols = {r[1] for r in c.fetchall()}
     if "description" not in cols:
         c.execute("ALTER TABLE pinterest_boards ADD COLUMN description TEXT")
 
+    c.execute("PRAGMA table_info(jobs)")
+    cols = {r[1] for r in c.fetchall()}
+    for col, typedef in [
+        ("progress", "INTEGER DEFAULT 0"),
+        ("total", "INTEGER"),
+        ("updated_at", "TIMESTAMP"),
+    ]:
+        if col not in cols:
+            c.execute(f"ALTER TABLE jobs ADD COLUMN {col} {typedef}")
+    if "updated_at" not in cols:
+        c.execute("UPDATE jobs SET updated_at = COALESCE(finished_at, started_at, created_at)")
+
+    c.execute("PRAGMA table_info(notifications)")
+    if "batch" not in {r[1] for r in c.fetchall()}:
+        c.execute("ALTER TABLE notifications ADD COLUMN batch TEXT")
+        c.execute("UPDATE notifications SET batch = 'n' || id")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notifications_batch ON notifications(batch, status)")
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_accounts_next_check ON accounts(enabled, next_check_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_accounts_failing ON accounts(error_count) WHERE error_count > 0")
+
+    if backfill:
+        c.execute("""
+            UPDATE accounts SET last_event_id = (
+                SELECT e.id FROM events e WHERE e.account_id = accounts.id
+                ORDER BY e.created_at DESC, e.id DESC LIMIT 1
+            )
+        """)
+        c.execute("UPDATE accounts SET last_event_at = (SELECT created_at FROM events WHERE id = accounts.last_event_id)")
+        _refresh_identity_last_event(c)
+
+    c.execute("SELECT 1 FROM event_counts WHERE scope = 'total'")
+    if not c.fetchone():
+        _rebuild_event_counts(c)
+
+
+def _refresh_identity_last_event(c, identity_id=None):
+    """Recompute identities.last_event_* from the per-account pointers."""
+    where, params = "", ()
+    if identity_id is not None:
+        where, params = "WHERE id = ?", (identity_id,)
+    c.execute(f"""
+        UPDATE identities SET last_event_id = (
+            SELECT a.last_event_id FROM accounts a
+            WHERE a.identity_id = identities.id AND a.last_event_id IS NOT NULL
+            ORDER BY a.last_event_at DESC, a.last_event_id DESC LIMIT 1
+        ) {where}
+    """, params)
+    c.execute(f"""
+        UPDATE identities SET last_event_at = (
+            SELECT created_at FROM events WHERE id = identities.last_event_id
+        ) {where}
+    """, params)
+
 
 def init_db():
     with get_db() as conn:
@@ -47,6 +207,8 @@ def init_db():
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL,
                 notes TEXT,
+                last_event_id INTEGER,
+                last_event_at TIMESTAMP,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
@@ -63,8 +225,17 @@ def init_db():
                 config_json TEXT,
                 last_checked TIMESTAMP,
                 last_data TEXT,
+                last_data_hash TEXT,
                 last_error TEXT,
                 error_count INTEGER DEFAULT 0,
+                last_event_id INTEGER,
+                last_event_at TIMESTAMP,
+                check_interval INTEGER,
+                unchanged_streak INTEGER DEFAULT 0,
+                hot BOOLEAN DEFAULT 0,
+                next_check_at REAL,
+                claimed_by TEXT,
+                lease_until REAL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (identity_id) REFERENCES identities(id) ON DELETE CASCADE,
                 UNIQUE(platform, username)
@@ -97,6 +268,15 @@ def init_db():
             )
         """)
 
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS event_counts (
+                scope TEXT NOT NULL,
+                scope_key TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (scope, scope_key)
+            )
+        """)
+
         c.execute("""
             CREATE TABLE IF NOT EXISTS settings (
                 key TEXT PRIMARY KEY,
@@ -104,11 +284,132 @@ def init_db():
             )
         """)
 
+        # Bumped by triggers on any settings change, from any process, so
+        # cached copies can tell when to reload
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS settings_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        """)
+        c.execute("INSERT OR IGNORE INTO settings_version (id, version) VALUES (1, 0)")
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            c.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS settings_{op.lower()}_version AFTER {op} ON settings
+                BEGIN UPDATE settings_version SET version = version + 1 WHERE id = 1; END
+            """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS check_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                account_id INTEGER NOT NULL,
+                platform TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                finished_at REAL,
+                duration_ms INTEGER,
+                outcome TEXT,
+                error TEXT,
+                http_calls INTEGER DEFAULT 0,
+                bytes INTEGER DEFAULT 0,
+                auth_ms INTEGER DEFAULT 0,
+                wait_ms INTEGER DEFAULT 0,
+                fetch_ms INTEGER DEFAULT 0,
+                parse_ms INTEGER DEFAULT 0,
+                diff_ms INTEGER DEFAULT 0,
+                db_ms INTEGER DEFAULT 0,
+                notify_ms INTEGER DEFAULT 0
+            )
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS nodes (
+                node TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS circuit_breakers (
+                node TEXT NOT NULL,
+                name TEXT NOT NULL,
+                platform TEXT,
+                state TEXT NOT NULL,
+                failures INTEGER DEFAULT 0,
+                error TEXT,
+                retry_at REAL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (node, name)
+            )
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS circuit_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                node TEXT,
+                at TEXT,
+                name TEXT,
+                platform TEXT,
+                from_state TEXT,
+                to_state TEXT,
+                error TEXT
+            )
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                account_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'queued',
+                progress INTEGER DEFAULT 0,
+                total INTEGER,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                summary TEXT NOT NULL,
+                platform TEXT,
+                username TEXT,
+                event_type TEXT,
+                batch TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                delivered TEXT NOT NULL DEFAULT '',
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at REAL NOT NULL,
+                claimed_until REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                sent_at TIMESTAMP
+            )
+        """)
+
         c.execute("CREATE INDEX IF NOT EXISTS idx_accounts_identity ON accounts(identity_id)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_accounts_platform ON accounts(platform)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_events_account ON events(account_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_events_created ON events(created_at DESC)")
+        c.execute("DROP INDEX IF EXISTS idx_events_created")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_events_created_id ON events(created_at DESC, id DESC)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_events_account_created ON events(account_id, created_at DESC, id DESC)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_boards_account ON pinterest_boards(account_id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_check_runs_account ON check_runs(account_id, id DESC)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_check_runs_started ON check_runs(started_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_notifications_due ON notifications(status, next_attempt_at)")
 
         _migrate(conn)
 
@@ -117,17 +418,66 @@ def init_db():
 # Identities
 # ---------------------------------------------------------------------------
 
-def get_all_identities():
+# Account projections. last_data can be large (Spotify keeps whole follower
+# lists) and is only read through get_last_data() while an account is being
+# checked; config_json may hold credentials and stays out of list responses.
+_ACCOUNT_LIST_COLUMNS = """id, identity_id, platform, username, display_name, enabled,
+    last_checked, last_error, error_count, last_event_id, last_event_at,
+    check_interval, hot, next_check_at, created_at"""
+_ACCOUNT_COLUMNS = _ACCOUNT_LIST_COLUMNS + ", config_json"
+_ACCOUNT_SCHEDULE_COLUMNS = """id, identity_id, platform, username, config_json, last_checked,
+    error_count, check_interval, hot"""
+
+def get_all_identities(limit=None, offset=0, with_latest_event=False):
+    """Load a page of identities with their accounts in a fixed number of queries.
+
+    Accounts (and, optionally, each identity's latest event via its
+    last_event_id pointer) are fetched for the whole page at once and grouped
+    in Python.
+    """
+    page = "SELECT id FROM identities ORDER BY name LIMIT ? OFFSET ?"
+    page_params = (-1 if limit is None else limit, offset)
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("SELECT * FROM identities ORDER BY name")
+        c.execute("SELECT * FROM identities ORDER BY name LIMIT ? OFFSET ?", page_params)
         identities = [dict(r) for r in c.fetchall()]
+        by_id = {}
         for ident in identities:
-            c.execute("SELECT * FROM accounts WHERE identity_id = ? ORDER BY platform, username", (ident["id"],))
-            ident["accounts"] = [dict(r) for r in c.fetchall()]
+            ident["accounts"] = []
+            by_id[ident["id"]] = ident
+        if not identities:
+            return identities
+
+        c.execute(f"""
+            SELECT {_ACCOUNT_LIST_COLUMNS} FROM accounts WHERE identity_id IN ({page})
+            ORDER BY platform, username
+        """, page_params)
+        for r in c.fetchall():
+            by_id[r["identity_id"]]["accounts"].append(dict(r))
+
+        if with_latest_event:
+            for ident in identities:
+                ident["latest_event"] = None
+            c.execute(f"""
+                SELECT e.*, a.platform, a.username, a.identity_id AS _identity_id
+                FROM identities i
+                JOIN events e ON e.id = i.last_event_id
+                JOIN accounts a ON e.account_id = a.id
+                WHERE i.id IN ({page})
+            """, page_params)
+            for r in c.fetchall():
+                event = dict(r)
+                by_id[event.pop("_identity_id")]["latest_event"] = event
         return identities
 
 
+def count_identities():
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*) FROM identities")
+        return c.fetchone()[0]
+
+
 def get_identity(identity_id):
     with get_db() as conn:
         c = conn.cursor()
@@ -136,7 +486,8 @@ def get_identity(identity_id):
         if not row:
             return None
         ident = dict(row)
-        c.execute("SELECT * FROM accounts WHERE identity_id = ? ORDER BY platform, username", (identity_id,))
+        c.execute(f"SELECT {_ACCOUNT_LIST_COLUMNS} FROM accounts WHERE identity_id = ? ORDER BY platform, username",
+                  (identity_id,))
         ident["accounts"] = [dict(r) for r in c.fetchall()]
         return ident
 
@@ -168,6 +519,16 @@ def update_identity(identity_id, **kwargs):
 def delete_identity(identity_id):
     with get_db() as conn:
         c = conn.cursor()
+        c.execute("""
+            SELECT a.id, a.platform, COALESCE(ec.count, 0) AS events
+            FROM accounts a
+            LEFT JOIN event_counts ec ON ec.scope = 'account' AND ec.scope_key = CAST(a.id AS TEXT)
+            WHERE a.identity_id = ?
+        """, (identity_id,))
+        for acc in c.fetchall():
+            _bump_event_counts(c, [("platform", acc["platform"]), ("total", "")], -acc["events"])
+            _drop_event_count(c, "account", acc["id"])
+        _drop_event_count(c, "identity", identity_id)
         c.execute("DELETE FROM identities WHERE id = ?", (identity_id,))
         return c.rowcount > 0
 
@@ -193,15 +554,46 @@ def add_account(identity_id, platform, username, display_name=None, config_json=
 def get_account(account_id):
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("SELECT * FROM accounts WHERE id = ?", (account_id,))
+        c.execute(f"SELECT {_ACCOUNT_COLUMNS} FROM accounts WHERE id = ?", (account_id,))
         row = c.fetchone()
         return dict(row) if row else None
 
 
+def get_last_data(account_id):
+    """Return the account's last snapshot, parsed, or {} if there is none."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT last_data FROM accounts WHERE id = ?", (account_id,))
+        row = c.fetchone()
+    if not row or not row["last_data"]:
+        return {}
+    try:
+        return json.loads(row["last_data"])
+    except (json.JSONDecodeError, TypeError):
+        return {}
+
+
+def _canonical(data):
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+
+def snapshot_hash(data):
+    """Stable hash of a snapshot; key order does not matter."""
+    return hashlib.sha256(_canonical(data).encode()).hexdigest()
+
+
+def get_last_data_hash(account_id):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT last_data_hash FROM accounts WHERE id = ?", (account_id,))
+        row = c.fetchone()
+        return row["last_data_hash"] if row else None
+
+
 def get_enabled_accounts():
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("SELECT * FROM accounts WHERE enabled = 1 ORDER BY platform, username")
+        c.execute(f"SELECT {_ACCOUNT_SCHEDULE_COLUMNS} FROM accounts WHERE enabled = 1 ORDER BY platform, username")
         return [dict(r) for r in c.fetchall()]
 
 
@@ -210,10 +602,19 @@ def update_account(account_id, **kwargs):
         c = conn.cursor()
         fields, values = [], []
         for key in ("username", "display_name", "enabled", "config_json",
-                     "last_checked", "last_data", "last_error", "error_count"):
+                     "last_checked", "last_data", "last_error", "error_count",
+                     "check_interval", "unchanged_streak", "hot", "next_check_at"):
             if key in kwargs:
                 fields.append(f"{key} = ?")
                 values.append(kwargs[key])
+        if "last_data" in kwargs:
+            # Keep the hash snapshot_unchanged() compares against in step
+            data = kwargs["last_data"]
+            if isinstance(data, str):
+                data = json.loads(data)
+            values[fields.index("last_data = ?")] = None if data is None else _canonical(data)
+            fields.append("last_data_hash = ?")
+            values.append(None if data is None else snapshot_hash(data))
         if not fields:
             return False
         values.append(account_id)
@@ -221,24 +622,151 @@ def update_account(account_id, **kwargs):
         return c.rowcount > 0
 
 
+def get_check_schedule():
+    """(id, next_check_at) for every enabled account."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, next_check_at FROM accounts WHERE enabled = 1")
+        return [dict(r) for r in c.fetchall()]
+
+
+def set_next_checks(schedule):
+    """Persist next_check_at for many accounts; ``schedule`` is (id, epoch) pairs."""
+    with get_db() as conn:
+        conn.executemany("UPDATE accounts SET next_check_at = ? WHERE id = ?",
+                         [(at, account_id) for account_id, at in schedule])
+
+
+# Sharded scheduling: worker processes claim accounts by writing their node
+# id and a lease expiry. A claim is only taken when the row is unclaimed or
+# its lease has lapsed, and each claim is a single UPDATE, so two nodes never
+# hold the same account at once.
+
+def claim_due_accounts(node, horizon, lease_seconds, limit, platform=None):
+    """Claim up to ``limit`` accounts (of ``platform``, if given) due by ``horizon`` for ``node``."""
+    now = time.time()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE accounts SET claimed_by = ?, lease_until = ?
+            WHERE id IN (
+                SELECT id FROM accounts
+                WHERE enabled = 1 AND next_check_at <= ?
+                AND (claimed_by IS NULL OR lease_until < ?)
+                AND (? IS NULL OR platform = ?)
+                ORDER BY next_check_at LIMIT ?
+            )
+            RETURNING id, next_check_at
+        """, (node, now + lease_seconds, horizon, now, platform, platform, limit))
+        return [dict(r) for r in c.fetchall()]
+
+
+def claim_account(account_id, node, lease_seconds):
+    """Claim (or extend ``node``'s claim on) one account; False if another node holds it."""
+    now = time.time()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE accounts SET claimed_by = ?, lease_until = ?
+            WHERE id = ? AND (claimed_by IS NULL OR claimed_by = ? OR lease_until < ?)
+        """, (node, now + lease_seconds, account_id, node, now))
+        return c.rowcount > 0
+
+
+def finish_claim(account_id, node, next_check_at):
+    """Set the next check and release ``node``'s claim; a no-op if the claim was lost."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE accounts SET next_check_at = ?, claimed_by = NULL, lease_until = NULL
+            WHERE id = ? AND claimed_by = ?
+        """, (next_check_at, account_id, node))
+        return c.rowcount > 0
+
+
+def release_claims(node, account_id=None):
+    with get_db() as conn:
+        c = conn.cursor()
+        if account_id is None:
+            c.execute("UPDATE accounts SET claimed_by = NULL, lease_until = NULL WHERE claimed_by = ?", (node,))
+        else:
+            c.execute("UPDATE accounts SET claimed_by = NULL, lease_until = NULL WHERE id = ? AND claimed_by = ?",
+                      (account_id, node))
+        return c.rowcount
+
+
+def get_account_activity(account_id, window_seconds):
+    """Scheduling inputs: recent event count, unchanged streak, hot flag and error count."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT a.unchanged_streak, a.hot, a.error_count,
+                   (SELECT COUNT(*) FROM events e WHERE e.account_id = a.id
+                    AND e.created_at >= datetime('now', ?)) AS recent_events
+            FROM accounts a WHERE a.id = ?
+        """, (f"-{int(window_seconds)} seconds", account_id))
+        row = c.fetchone()
+        return dict(row) if row else None
+
+
 def record_check_success(account_id, last_data=None):
-    kwargs = {"last_checked": datetime.utcnow(), "last_error": None, "error_count": 0}
-    if last_data is not None:
-        kwargs["last_data"] = last_data if isinstance(last_data, str) else json.dumps(last_data)
-    return update_account(account_id, **kwargs)
+    if last_data is None:
+        return update_account(account_id, last_checked=datetime.utcnow(), last_error=None, error_count=0)
+    if isinstance(last_data, str):
+        last_data = json.loads(last_data)
+    blob = _canonical(last_data)
+    data_hash = hashlib.sha256(blob.encode()).hexdigest()
+    with get_db() as conn:
+        c = conn.cursor()
+        # unchanged_streak counts consecutive checks whose snapshot matched the
+        # previous one; SET expressions see the row as it was before the update.
+        c.execute("""
+            UPDATE accounts SET
+                unchanged_streak = CASE WHEN last_data_hash IS ? THEN COALESCE(unchanged_streak, 0) + 1 ELSE 0 END,
+                last_data = ?, last_data_hash = ?, last_checked = ?, last_error = NULL, error_count = 0
+            WHERE id = ?
+        """, (data_hash, blob, data_hash, datetime.utcnow(), account_id))
+        return c.rowcount > 0
+
+
+def record_check_unchanged(account_id):
+    """A successful check whose snapshot matched the stored one: leave last_data alone."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE accounts SET unchanged_streak = COALESCE(unchanged_streak, 0) + 1,
+                last_checked = ?, last_error = NULL, error_count = 0
+            WHERE id = ?
+        """, (datetime.utcnow(), account_id))
+        return c.rowcount > 0
 
 
 def record_check_error(account_id, error_msg):
-    acc = get_account(account_id)
-    count = (acc.get("error_count") or 0) + 1 if acc else 1
-    return update_account(account_id, last_error=str(error_msg), error_count=count)
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute(
+            "UPDATE accounts SET last_error = ?, error_count = COALESCE(error_count, 0) + 1 WHERE id = ?",
+            (str(error_msg), account_id),
+        )
+        return c.rowcount > 0
 
 
 def delete_account(account_id):
     with get_db() as conn:
         c = conn.cursor()
+        c.execute("SELECT identity_id, platform FROM accounts WHERE id = ?", (account_id,))
+        row = c.fetchone()
+        if not row:
+            return False
+        c.execute("SELECT count FROM event_counts WHERE scope = 'account' AND scope_key = ?", (str(account_id),))
+        counted = c.fetchone()
+        if counted:
+            _bump_event_counts(c, [("identity", row["identity_id"]), ("platform", row["platform"]),
+                                   ("total", "")], -counted["count"])
+        _drop_event_count(c, "account", account_id)
         c.execute("DELETE FROM accounts WHERE id = ?", (account_id,))
-        return c.rowcount > 0
+        _refresh_identity_last_event(c, row["identity_id"])
+        return True
 
 
 # ---------------------------------------------------------------------------
@@ -254,7 +782,19 @@ def add_event(account_id, event_type, summary, event_data=None):
             "INSERT INTO events (account_id, event_type, summary, event_data) VALUES (?, ?, ?, ?)",
             (account_id, event_type, summary, event_data),
         )
-        return c.lastrowid
+        event_id = c.lastrowid
+        c.execute("""
+            UPDATE accounts SET last_event_id = ?,
+                   last_event_at = (SELECT created_at FROM events WHERE id = ?)
+            WHERE id = ?
+            RETURNING identity_id, platform, last_event_at
+        """, (event_id, event_id, account_id))
+        acc = c.fetchone()
+        c.execute("UPDATE identities SET last_event_id = ?, last_event_at = ? WHERE id = ?",
+                  (event_id, acc["last_event_at"], acc["identity_id"]))
+        _bump_event_counts(c, [("account", account_id), ("identity", acc["identity_id"]),
+                               ("platform", acc["platform"]), ("total", "")], 1)
+        return event_id
 
 
 def get_event(event_id):
@@ -271,7 +811,15 @@ def get_event(event_id):
         return dict(row) if row else None
 
 
-def get_events(account_id=None, identity_id=None, platform=None, limit=100, offset=0):
+def get_events(account_id=None, identity_id=None, platform=None, limit=100, offset=0,
+               before=None, after=None):
+    """Return events newest first.
+
+    ``before``/``after`` are ``(created_at, id)`` keys for keyset paging:
+    ``before`` returns the page of older events following that key, ``after``
+    the page of newer events preceding it. ``offset`` is still honoured for
+    callers that page by position.
+    """
     with get_db() as conn:
         c = conn.cursor()
         query = """
@@ -290,17 +838,43 @@ def get_events(account_id=None, identity_id=None, platform=None, limit=100, offs
         if platform is not None:
             conditions.append("a.platform = ?")
             params.append(platform)
+        if before is not None:
+            conditions.append("(e.created_at, e.id) < (?, ?)")
+            params.extend(before)
+        if after is not None:
+            conditions.append("(e.created_at, e.id) > (?, ?)")
+            params.extend(after)
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
-        query += " ORDER BY e.created_at DESC LIMIT ? OFFSET ?"
+        if after is not None and before is None:
+            query += " ORDER BY e.created_at ASC, e.id ASC LIMIT ? OFFSET ?"
+        else:
+            query += " ORDER BY e.created_at DESC, e.id DESC LIMIT ? OFFSET ?"
         params.extend([limit, offset])
         c.execute(query, params)
-        return [dict(r) for r in c.fetchall()]
+        events = [dict(r) for r in c.fetchall()]
+        if after is not None and before is None:
+            events.reverse()
+        return events
 
 
 def get_event_count(account_id=None, identity_id=None, platform=None):
+    """Exact event count for a filter, read from event_counts when possible.
+
+    A single filter (or none) is a counter lookup; combined filters fall back
+    to counting rows.
+    """
+    filters = [(scope, key) for scope, key in
+               (("account", account_id), ("identity", identity_id), ("platform", platform))
+               if key is not None]
     with get_db() as conn:
         c = conn.cursor()
+        if len(filters) <= 1:
+            scope, key = filters[0] if filters else ("total", "")
+            c.execute("SELECT count FROM event_counts WHERE scope = ? AND scope_key = ?", (scope, str(key)))
+            row = c.fetchone()
+            return row["count"] if row else 0
+
         query = "SELECT COUNT(*) FROM events e JOIN accounts a ON e.account_id = a.id"
         conditions, params = [], []
         if account_id is not None:
@@ -312,26 +886,113 @@ def get_event_count(account_id=None, identity_id=None, platform=None):
         if platform is not None:
             conditions.append("a.platform = ?")
             params.append(platform)
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
+        query += " WHERE " + " AND ".join(conditions)
         c.execute(query, params)
         return c.fetchone()[0]
 
 
+def _bump_event_counts(c, keys, delta):
+    c.executemany("""
+        INSERT INTO event_counts (scope, scope_key, count) VALUES (?, ?, ?)
+        ON CONFLICT(scope, scope_key) DO UPDATE SET count = count + excluded.count
+    """, [(scope, str(key), delta) for scope, key in keys])
+
+
+def _drop_event_count(c, scope, key):
+    c.execute("DELETE FROM event_counts WHERE scope = ? AND scope_key = ?", (scope, str(key)))
+
+
+def _rebuild_event_counts(c):
+    """Recount every event_counts row from the events table."""
+    c.execute("DELETE FROM event_counts")
+    c.execute("""
+        INSERT INTO event_counts (scope, scope_key, count)
+        SELECT 'account', CAST(account_id AS TEXT), COUNT(*) FROM events GROUP BY account_id
+    """)
+    c.execute("""
+        INSERT INTO event_counts (scope, scope_key, count)
+        SELECT 'identity', CAST(a.identity_id AS TEXT), COUNT(*)
+        FROM events e JOIN accounts a ON e.account_id = a.id GROUP BY a.identity_id
+    """)
+    c.execute("""
+        INSERT INTO event_counts (scope, scope_key, count)
+        SELECT 'platform', a.platform, COUNT(*)
+        FROM events e JOIN accounts a ON e.account_id = a.id GROUP BY a.platform
+    """)
+    c.execute("INSERT INTO event_counts (scope, scope_key, count) SELECT 'total', '', COUNT(*) FROM events")
+
+
 def get_identity_latest_event(identity_id):
     with get_db() as conn:
         c = conn.cursor()
         c.execute("""
             SELECT e.*, a.platform, a.username
-            FROM events e
+            FROM identities i
+            JOIN events e ON e.id = i.last_event_id
             JOIN accounts a ON e.account_id = a.id
-            WHERE a.identity_id = ?
-            ORDER BY e.created_at DESC LIMIT 1
+            WHERE i.id = ?
         """, (identity_id,))
         row = c.fetchone()
         return dict(row) if row else None
 
 
+# ---------------------------------------------------------------------------
+# Stats
+# ---------------------------------------------------------------------------
+
+def get_stats(recent_hours=24):
+    """Dashboard totals plus a per-platform breakdown, computed in SQL."""
+    since = f"-{int(recent_hours)} hours"
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT (SELECT COUNT(*) FROM identities) AS identities,
+                   (SELECT COUNT(*) FROM accounts) AS accounts,
+                   (SELECT COUNT(*) FROM events WHERE created_at >= datetime('now', ?)) AS recent_events
+        """, (since,))
+        stats = dict(c.fetchone())
+
+        platforms = {}
+        c.execute("""
+            SELECT platform, COUNT(*) AS accounts, SUM(enabled = 1) AS enabled,
+                   SUM(error_count > 0) AS failing
+            FROM accounts GROUP BY platform
+        """)
+        for r in c.fetchall():
+            platforms[r["platform"]] = {"accounts": r["accounts"], "enabled": r["enabled"],
+                                        "failing": r["failing"], "events": 0, "recent_events": 0}
+        c.execute("SELECT scope_key, count FROM event_counts WHERE scope = 'platform'")
+        for r in c.fetchall():
+            if r["scope_key"] in platforms:
+                platforms[r["scope_key"]]["events"] = r["count"]
+        c.execute("""
+            SELECT a.platform, COUNT(*) AS recent_events
+            FROM events e JOIN accounts a ON e.account_id = a.id
+            WHERE e.created_at >= datetime('now', ?)
+            GROUP BY a.platform
+        """, (since,))
+        for r in c.fetchall():
+            if r["platform"] in platforms:
+                platforms[r["platform"]]["recent_events"] = r["recent_events"]
+        stats["platforms"] = platforms
+        return stats
+
+
+def get_alert_accounts():
+    """Accounts whose last check failed, worst first."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT a.id AS account_id, a.username, a.platform, i.name AS identity_name,
+                   COALESCE(a.last_error, 'Unknown error') AS error, a.error_count
+            FROM accounts a
+            JOIN identities i ON a.identity_id = i.id
+            WHERE a.error_count > 0
+            ORDER BY a.error_count DESC, a.id
+        """)
+        return [dict(r) for r in c.fetchall()]
+
+
 # ---------------------------------------------------------------------------
 # Pinterest boards
 # ---------------------------------------------------------------------------
@@ -376,29 +1037,585 @@ def update_pinterest_board(board_id, pin_count, name=None, description=None):
 # Settings
 # ---------------------------------------------------------------------------
 
-def get_setting(key, default=None):
+# Settings are read for every check and notification, so they are served
+# from an in-process copy. Writes through this module update the copy once
+# their transaction commits, so a rollback leaves it untouched. Changes made by other processes bump settings_version, which is
+# checked at most every SETTINGS_POLL seconds (0 = never).
+_settings = None
+_settings_version = None
+_settings_checked = 0.0
+_settings_lock = threading.Lock()
+
+
+def _cached_settings():
+    global _settings, _settings_version, _settings_checked
+    cache = _settings
+    if cache is not None and (config.SETTINGS_POLL <= 0
+                              or time.monotonic() - _settings_checked < config.SETTINGS_POLL):
+        return cache
+    # Query without holding the lock: a thread waiting on it may hold a pooled connection
+    loaded = None
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("SELECT value FROM settings WHERE key = ?", (key,))
-        row = c.fetchone()
-        return row["value"] if row else default
+        c.execute("SELECT version FROM settings_version WHERE id = 1")
+        version = c.fetchone()[0]
+        if cache is None or version != _settings_version:
+            c.execute("SELECT key, value FROM settings")
+            loaded = {r["key"]: r["value"] for r in c.fetchall()}
+    with _settings_lock:
+        if _settings is cache:  # nobody wrote through or reloaded meanwhile
+            if loaded is not None:
+                _settings, _settings_version = loaded, version
+            _settings_checked = time.monotonic()
+        if _settings is not None:
+            return _settings
+    return loaded if loaded is not None else cache
+
+
+def _update_cached_setting(key, value=None, delete=False):
+    """Write through to the cached copy (replaced, never mutated, so readers need no lock)."""
+    global _settings, _settings_version
+    with _settings_lock:
+        if _settings is None:
+            return
+        updated = dict(_settings)
+        if delete:
+            updated.pop(key, None)
+        else:
+            updated[key] = value
+        _settings = updated
+        # Our own write bumped the version; re-read it on the next poll
+        _settings_version = None
+
+
+def get_setting(key, default=None):
+    return _cached_settings().get(key, default)
 
 
 def get_all_settings():
-    with get_db() as conn:
-        c = conn.cursor()
-        c.execute("SELECT key, value FROM settings ORDER BY key")
-        return {r["key"]: r["value"] for r in c.fetchall()}
+    return dict(sorted(_cached_settings().items()))
 
 
 def set_setting(key, value):
     with get_db() as conn:
         c = conn.cursor()
         c.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
+        _on_commit(_update_cached_setting, key, str(value))
 
 
 def delete_setting(key):
     with get_db() as conn:
         c = conn.cursor()
         c.execute("DELETE FROM settings WHERE key = ?", (key,))
+        deleted = c.rowcount > 0
+        _on_commit(_update_cached_setting, key, None, True)
+    return deleted
+
+
+# ---------------------------------------------------------------------------
+# Leases
+# ---------------------------------------------------------------------------
+
+# A lease is a named row owned by one process until expires_at (epoch
+# seconds). The holder keeps it by renewing before it lapses; anyone may
+# take it over once it has expired.
+
+def acquire_lease(name, holder, ttl):
+    """Take or renew ``name`` for ``ttl`` seconds; True if ``holder`` now owns it."""
+    now = time.time()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+            WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+        """, (name, holder, now + ttl, now))
         return c.rowcount > 0
+
+
+def release_lease(name, holder):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+        return c.rowcount > 0
+
+
+def get_lease(name):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM leases WHERE name = ?", (name,))
+        row = c.fetchone()
+        return dict(row) if row else None
+
+
+# ---------------------------------------------------------------------------
+# Nodes
+# ---------------------------------------------------------------------------
+
+# Every process running the scheduler publishes its status (queue, cycle and
+# duration stats) on each heartbeat, so a web-only process can show them.
+
+def publish_node(node, status):
+    with get_db() as conn:
+        conn.execute("""
+            INSERT INTO nodes (node, status, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(node) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at
+        """, (node, json.dumps(status), time.time()))
+
+
+def remove_node(node):
+    with get_db() as conn:
+        conn.execute("DELETE FROM nodes WHERE node = ?", (node,))
+
+
+def get_nodes(max_age):
+    """Statuses published within the last ``max_age`` seconds; older rows are pruned."""
+    now = time.time()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM nodes WHERE updated_at < ?", (now - 10 * max_age,))
+        c.execute("SELECT status, updated_at FROM nodes WHERE updated_at >= ? ORDER BY node", (now - max_age,))
+        return [dict(json.loads(r["status"]), updated_ago=round(now - r["updated_at"], 1)) for r in c.fetchall()]
+
+
+# ---------------------------------------------------------------------------
+# Circuit breakers
+# ---------------------------------------------------------------------------
+
+# Breakers live in the processes that run checks. Each one publishes its
+# breakers that are not closed, and its state changes, on every heartbeat,
+# so a web process can report them. Rows of a node that stopped publishing
+# are ignored once stale.
+
+CIRCUIT_EVENTS_KEEP = 200
+
+
+def publish_circuits(node, circuits, transitions):
+    """Replace ``node``'s published breakers and append its new state changes."""
+    now = time.time()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM circuit_breakers WHERE node = ?", (node,))
+        c.executemany("""
+            INSERT INTO circuit_breakers (node, name, platform, state, failures, error, retry_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(node, b["name"], b["platform"], b["state"], b["failures"], b["error"],
+               now + b["retry_in"], now) for b in circuits])
+        if transitions:
+            c.executemany("""
+                INSERT INTO circuit_events (node, at, name, platform, from_state, to_state, error)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(node, t["at"], t["name"], t["platform"], t["from"], t["to"], t["error"]) for t in transitions])
+            c.execute("DELETE FROM circuit_events WHERE id <= (SELECT MAX(id) FROM circuit_events) - ?",
+                      (CIRCUIT_EVENTS_KEEP,))
+
+
+def clear_circuits(node):
+    with get_db() as conn:
+        conn.execute("DELETE FROM circuit_breakers WHERE node = ?", (node,))
+
+
+def get_circuit_alerts(max_age):
+    """Breakers not closed, as published within the last ``max_age`` seconds."""
+    now = time.time()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT node, name, platform, state, failures, error, retry_at FROM circuit_breakers
+            WHERE updated_at >= ? ORDER BY name, node
+        """, (now - max_age,))
+        alerts = []
+        for row in c.fetchall():
+            alert = dict(row)
+            alert["retry_in"] = round(max(0.0, (alert.pop("retry_at") or now) - now))
+            alerts.append(alert)
+        return alerts
+
+
+def get_circuit_events(limit=50):
+    """Newest first, in the shape breaker transitions are recorded in."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT node, at, name, platform, from_state AS "from", to_state AS "to", error
+            FROM circuit_events ORDER BY id DESC LIMIT ?
+        """, (limit,))
+        return [dict(r) for r in c.fetchall()]
+
+
+# ---------------------------------------------------------------------------
+# Jobs
+# ---------------------------------------------------------------------------
+
+# Manual check requests from the web process. Whichever process runs the
+# scheduler claims them; results show up as events and account state. A
+# request for work that is already queued or running joins that job, so
+# repeated clicks coalesce instead of stacking.
+
+_ACTIVE_JOB = "kind = ? AND account_id IS ? AND status IN ('queued', 'running')"
+
+
+def enqueue_job(kind, account_id=None):
+    """Queue a job; returns (job_id, created), joining an active job of the same kind."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute(f"""
+            INSERT INTO jobs (kind, account_id)
+            SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE {_ACTIVE_JOB})
+        """, (kind, account_id, kind, account_id))
+        if c.rowcount:
+            return c.lastrowid, True
+        c.execute(f"SELECT id FROM jobs WHERE {_ACTIVE_JOB} ORDER BY id LIMIT 1", (kind, account_id))
+        return c.fetchone()["id"], False
+
+
+def claim_jobs(limit=10):
+    """Atomically move up to ``limit`` queued jobs to running and return them."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE jobs SET status = 'running', started_at = CURRENT_TIMESTAMP,
+                            updated_at = CURRENT_TIMESTAMP
+            WHERE id IN (SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT ?)
+            RETURNING *
+        """, (limit,))
+        return sorted((dict(r) for r in c.fetchall()), key=lambda j: j["id"])
+
+
+def update_job_progress(job_id, progress, total=None):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE jobs SET progress = ?, total = COALESCE(?, total), updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (progress, total, job_id))
+
+
+def finish_job(job_id, error=None):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE jobs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP,
+                            updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, ("failed" if error else "done", error, job_id))
+
+
+def fail_stale_jobs(stale_seconds):
+    """Fail running jobs that stopped reporting, e.g. because their worker died."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE jobs SET status = 'failed', error = 'Abandoned', finished_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND updated_at < datetime('now', ?)
+        """, (f"-{int(stale_seconds)} seconds",))
+        return c.rowcount
+
+
+def get_job(job_id):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        row = c.fetchone()
+        return dict(row) if row else None
+
+
+def count_active_jobs():
+    """Queued and running job counts."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY status")
+        counts = {"queued": 0, "running": 0}
+        counts.update(c.fetchall())
+        return counts
+
+
+def get_jobs(limit=20):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [dict(r) for r in c.fetchall()]
+
+
+def prune_jobs(keep_days=7):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            DELETE FROM jobs WHERE status IN ('done', 'failed')
+            AND finished_at < datetime('now', ?)
+        """, (f"-{int(keep_days)} days",))
+        return c.rowcount
+
+
+# ---------------------------------------------------------------------------
+# Notification outbox
+# ---------------------------------------------------------------------------
+
+# Checks only insert here; notifier.Sender claims due rows, delivers them
+# and records which destinations succeeded so a retry skips those. Rows
+# sharing a batch are claimed and sent together as one digest.
+
+def _digest(platform, username, session_batch=None):
+    """(batch, delay) for a new notification under the NOTIFY_DIGEST mode."""
+    if config.NOTIFY_DIGEST == "window":
+        return f"{platform}:{username}", config.NOTIFY_DIGEST_WINDOW
+    if config.NOTIFY_DIGEST == "check" and session_batch:
+        return session_batch, 0
+    return uuid4().hex, 0
+
+
+def enqueue_notification(summary, platform=None, username=None, event_type=None, batch=None):
+    batch, delay = _digest(platform, username, batch)
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO notifications (summary, platform, username, event_type, batch, next_attempt_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (summary, platform, username, event_type, batch, time.time() + delay))
+        return c.lastrowid
+
+
+def claim_notifications(limit, lease_seconds):
+    """Claim up to ``limit`` due batches, including ones whose sender died mid-send.
+
+    A batch is due once its earliest row is; every pending row of it is
+    claimed, so events that arrived since join the same digest.
+    """
+    now = time.time()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE notifications SET status = 'sending', claimed_until = ?
+            WHERE (status = 'pending' OR (status = 'sending' AND claimed_until < ?))
+            AND batch IN (
+                SELECT batch FROM notifications
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                   OR (status = 'sending' AND claimed_until < ?)
+                GROUP BY batch ORDER BY MIN(id) LIMIT ?
+            )
+            RETURNING *
+        """, (now + lease_seconds, now, now, now, limit))
+        return sorted((dict(r) for r in c.fetchall()), key=lambda r: r["id"])
+
+
+def notification_sent(notification_id, delivered):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE notifications SET status = 'sent', delivered = ?, attempts = attempts + 1,
+            last_error = NULL, claimed_until = NULL, sent_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (delivered, notification_id))
+
+
+def notification_failed(notification_id, delivered, error, retry_at=None, attempted=True):
+    """Record a failed send; without ``retry_at`` the notification is given up.
+
+    ``attempted=False`` (a rate-limited send) does not count towards the
+    attempt limit.
+    """
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE notifications SET status = ?, delivered = ?, attempts = attempts + ?,
+            last_error = ?, next_attempt_at = COALESCE(?, next_attempt_at), claimed_until = NULL
+            WHERE id = ?
+        """, ("pending" if retry_at else "failed", delivered, int(attempted), error, retry_at, notification_id))
+
+
+def count_notifications():
+    """Outbox rows still pending or being sent."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT status, COUNT(*) FROM notifications "
+                  "WHERE status IN ('pending', 'sending') GROUP BY status")
+        counts = {"pending": 0, "sending": 0}
+        counts.update(c.fetchall())
+        return counts
+
+
+def prune_notifications(keep_days=7):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            DELETE FROM notifications WHERE status IN ('sent', 'failed', 'skipped')
+            AND created_at < datetime('now', ?)
+        """, (f"-{int(keep_days)} days",))
+        return c.rowcount
+
+
+def skip_notifications(notification_ids):
+    """Mark claimed notifications as dropped, e.g. because notifications are disabled."""
+    if not notification_ids:
+        return
+    with get_db() as conn:
+        c = conn.cursor()
+        c.executemany("UPDATE notifications SET status = 'skipped', claimed_until = NULL WHERE id = ?",
+                      [(i,) for i in notification_ids])
+
+
+# ---------------------------------------------------------------------------
+# Check runs
+# ---------------------------------------------------------------------------
+
+# One row per check with its outcome, HTTP volume and per-phase timings
+# (see tracing.py). Times are epoch seconds, durations milliseconds.
+
+_CHECK_RUN_FIELDS = ("account_id", "platform", "started_at", "finished_at", "duration_ms",
+                     "outcome", "error", "http_calls", "bytes") + tuple(f"{p}_ms" for p in tracing.PHASES)
+
+
+def add_check_run(run):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute(f"""
+            INSERT INTO check_runs ({", ".join(_CHECK_RUN_FIELDS)})
+            VALUES ({", ".join("?" * len(_CHECK_RUN_FIELDS))})
+        """, tuple(run.get(f) for f in _CHECK_RUN_FIELDS))
+        return c.lastrowid
+
+
+def get_check_runs(account_id=None, platform=None, outcome=None, limit=50, before=None):
+    """Newest first; ``before`` is a check_runs id to page from."""
+    clauses, params = [], []
+    if account_id:
+        clauses.append("r.account_id = ?")
+        params.append(account_id)
+    if platform:
+        clauses.append("r.platform = ?")
+        params.append(platform)
+    if outcome:
+        clauses.append("r.outcome = ?")
+        params.append(outcome)
+    if before:
+        clauses.append("r.id < ?")
+        params.append(before)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT r.*, a.username FROM check_runs r
+            LEFT JOIN accounts a ON a.id = r.account_id
+            {where} ORDER BY r.id DESC LIMIT ?
+        """, params + [limit])
+        return [dict(r) for r in c.fetchall()]
+
+
+def get_check_run_summary(since, limit=20):
+    """Per-account totals since ``since`` (epoch seconds), most time-consuming first."""
+    phases = ", ".join(f"SUM(r.{p}_ms) AS {p}_ms" for p in tracing.PHASES)
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT r.account_id, a.username, r.platform, COUNT(*) AS runs,
+                   SUM(r.duration_ms) AS total_ms, CAST(AVG(r.duration_ms) AS INTEGER) AS avg_ms,
+                   MAX(r.duration_ms) AS max_ms, SUM(r.outcome != 'ok') AS failed,
+                   SUM(r.http_calls) AS http_calls, SUM(r.bytes) AS bytes, {phases}
+            FROM check_runs r LEFT JOIN accounts a ON a.id = r.account_id
+            WHERE r.started_at >= ?
+            GROUP BY r.account_id ORDER BY total_ms DESC LIMIT ?
+        """, (since, limit))
+        return [dict(r) for r in c.fetchall()]
+
+
+def prune_check_runs(keep_days=7):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM check_runs WHERE started_at < ?", (time.time() - keep_days * 86400,))
+        return c.rowcount
+
+
+# ---------------------------------------------------------------------------
+# Check sessions
+# ---------------------------------------------------------------------------
+
+def _buffered(fn):
+    def method(self, *args, **kwargs):
+        self._ops.append((fn, args, kwargs))
+    method.__name__ = fn.__name__
+    method.__doc__ = fn.__doc__
+    return method
+
+
+class CheckSession:
+    """Unit of work for a single monitor check.
+
+    Monitors receive a session in place of this module. Writes are buffered
+    and applied together in one transaction by commit(), so a check costs a
+    single commit no matter how many events it records. Reads go straight to
+    the database. Notifications go into the outbox in that same transaction,
+    and the sender is woken once it has committed.
+
+    Async monitors must not read on the event loop: they hand blocking work
+    to ``run_blocking``, which uses the session's executor.
+    """
+
+    def __init__(self, executor=None):
+        self.executor = executor  # None: the loop's default executor
+        self._ops = []
+        self._notified = False
+        self._batch = uuid4().hex  # digest key for this check's notifications
+        self.error = None  # last error recorded through record_check_error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def commit(self):
+        ops, self._ops = self._ops, []
+        notified, self._notified = self._notified, False
+        if ops:
+            with tracing.phase("db"), get_db():
+                for fn, args, kwargs in ops:
+                    fn(*args, **kwargs)
+        if notified:
+            import notifier
+            with tracing.phase("notify"):
+                notifier.kick()
+
+    def rollback(self):
+        self._ops = []
+        self._notified = False
+
+    async def run_blocking(self, fn, *args):
+        """Await ``fn(*args)`` on the session's executor, keeping the check's trace."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, contextvars.copy_context().run, fn, *args)
+
+    def snapshot_unchanged(self, account_id, data):
+        """True if ``data`` hashes like the stored snapshot, recording the check as unchanged.
+
+        The monitor can then skip loading the old snapshot, diffing and
+        rewriting last_data.
+        """
+        if snapshot_hash(data) != get_last_data_hash(account_id):
+            return False
+        self._ops.append((record_check_unchanged, (account_id,), {}))
+        return True
+
+    def notify(self, summary, platform=None, username=None, event_type=None, event_data=None):
+        """Queue a notification in the outbox; it is sent in the background after commit."""
+        self._ops.append((enqueue_notification, (summary, platform, username, event_type, self._batch), {}))
+        self._notified = True
+
+    get_account = staticmethod(get_account)
+    get_last_data = staticmethod(get_last_data)
+    get_pinterest_boards = staticmethod(get_pinterest_boards)
+    get_setting = staticmethod(get_setting)
+
+    add_event = _buffered(add_event)
+    add_pinterest_board = _buffered(add_pinterest_board)
+    update_pinterest_board = _buffered(update_pinterest_board)
+    record_check_success = _buffered(record_check_success)
+
+    def record_check_error(self, account_id, error_msg):
+        self.error = error_msg
+        self._ops.append((record_check_error, (account_id, error_msg), {}))
+
+    set_setting = _buffered(set_setting)
@@ -1,10 +1,16 @@
 import asyncio
 import logging
 import sys
+import time
 from pathlib import Path
 
+import metrics
+
 logger = logging.getLogger(__name__)
 
+SEARCH_SECONDS = metrics.Histogram("coral_maigret_search_seconds", "Maigret search duration", ["result"],
+                                   buckets=(1, 5, 10, 30, 60, 120, 300, 600))
+
 MAIGRET_ROOT = Path(__file__).resolve().parent.parent / "maigret"
 MAIGRET_DB_FILE = None
 MAIGRET_AVAILABLE = False
@@ -62,10 +68,16 @@ def search(username, top_sites=500, timeout=5, max_connections=50, retries=0,
     sl = logging.getLogger("maigret")
     sl.setLevel(logging.WARNING)
 
-    results = _run_coro(maigret.search(
-        username=username, site_dict=sites, timeout=timeout, logger=sl,
-        id_type=id_type, max_connections=max_connections, no_progressbar=True,
-        retries=retries, check_domains=check_domains,
-        cookies=str(cookies_file) if cookies_file else None,
-    ))
+    started = time.perf_counter()
+    result = "error"
+    try:
+        results = _run_coro(maigret.search(
+            username=username, site_dict=sites, timeout=timeout, logger=sl,
+            id_type=id_type, max_connections=max_connections, no_progressbar=True,
+            retries=retries, check_domains=check_domains,
+            cookies=str(cookies_file) if cookies_file else None,
+        ))
+        result = "ok"
+    finally:
+        SEARCH_SECONDS.observe(time.perf_counter() - started, result=result)
     return results, len(sites)
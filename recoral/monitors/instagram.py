@@ -1,7 +1,12 @@
 import json
 import logging
+import threading
 from datetime import datetime
 
+import breaker
+import ratelimit
+import tracing
+
 logger = logging.getLogger(__name__)
 
 try:
@@ -17,21 +22,23 @@ class InstagramMonitor:
         if not AVAILABLE:
             return
         self._loaders = {}
+        self._lock = threading.Lock()
 
     def _get_loader(self, session_username=None):
         if not AVAILABLE:
             raise RuntimeError("instaloader not available")
-        if session_username in self._loaders:
-            return self._loaders[session_username]
-        loader = instaloader.Instaloader()
-        if session_username:
-            try:
-                loader.load_session_from_file(session_username)
-                logger.info("Instagram session loaded for %s", session_username)
-            except Exception as e:
-                logger.warning("Failed to load Instagram session for %s: %s", session_username, e)
-        self._loaders[session_username] = loader
-        return loader
+        with self._lock:
+            if session_username in self._loaders:
+                return self._loaders[session_username]
+            loader = instaloader.Instaloader()
+            if session_username:
+                try:
+                    loader.load_session_from_file(session_username)
+                    logger.info("Instagram session loaded for %s", session_username)
+                except Exception as e:
+                    logger.warning("Failed to load Instagram session for %s: %s", session_username, e)
+            self._loaders[session_username] = loader
+            return loader
 
     def _resolve_session(self, account):
         config = {}
@@ -51,8 +58,14 @@ class InstagramMonitor:
         return session_username
 
     def get_profile(self, username, session_username=None):
-        loader = self._get_loader(session_username)
-        p = instaloader.Profile.from_username(loader.context, username)
+        with tracing.phase("auth"):
+            loader = self._get_loader(session_username)
+        with tracing.phase("wait"):
+            ratelimit.acquire("instagram")
+        with tracing.phase("fetch"):
+            # instaloader does not expose response sizes, so only calls are counted
+            tracing.record_http()
+            p = instaloader.Profile.from_username(loader.context, username)
         return {
             "followers": p.followers,
             "followings": p.followees,
@@ -103,6 +116,8 @@ class InstagramMonitor:
         logger.info("Checking Instagram: %s", username)
 
         session_username = self._resolve_session(account)
+        circuit = breaker.get("instagram", session_username)
+        circuit.check()
 
         try:
             data = self.get_profile(username, session_username)
@@ -113,6 +128,7 @@ class InstagramMonitor:
 
             if is_rate:
                 logger.error("Instagram %s: rate limited", username)
+                circuit.record_failure("Rate limited by Instagram")
                 db.record_check_error(account_id, "Rate limited by Instagram")
                 return
 
@@ -121,8 +137,9 @@ class InstagramMonitor:
                 new_session = self._try_browser_reimport(session_username)
                 if new_session:
                     # Clear cached loader so it picks up new session
-                    self._loaders.pop(session_username, None)
-                    self._loaders.pop(new_session, None)
+                    with self._lock:
+                        self._loaders.pop(session_username, None)
+                        self._loaders.pop(new_session, None)
                     try:
                         data = self.get_profile(username, new_session)
                         logger.info("Instagram %s: browser reimport succeeded", username)
@@ -131,34 +148,40 @@ class InstagramMonitor:
                             db.set_setting("instagram_session", new_session)
                     except Exception as retry_err:
                         logger.error("Instagram %s: reimport failed too: %s", username, retry_err)
+                        circuit.record_failure("Session expired")
                         db.record_check_error(account_id, "Session expired. Log into instagram.com in your browser to auto-fix.")
-                        from notifier import notify
-                        notify(f"Instagram session expired for @{username}. Log into instagram.com in your browser.",
-                               "instagram", username, "session_expired")
+                        db.notify(f"Instagram session expired for @{username}. Log into instagram.com in your browser.",
+                                  "instagram", username, "session_expired")
                         return
                 else:
+                    circuit.record_failure("Session expired")
                     db.record_check_error(account_id, "Session expired. Log into instagram.com in your browser to auto-fix.")
-                    from notifier import notify
-                    notify(f"Instagram session expired for @{username}. Log into instagram.com in your browser.",
-                           "instagram", username, "session_expired")
+                    db.notify(f"Instagram session expired for @{username}. Log into instagram.com in your browser.",
+                              "instagram", username, "session_expired")
                     return
             else:
                 logger.error("Instagram %s: %s", username, e)
+                circuit.record_failure(e)
                 db.record_check_error(account_id, str(e))
                 return
         except Exception as e:
             logger.error("Instagram fetch failed for %s: %s", username, e)
             db.record_check_error(account_id, str(e))
             return
+        circuit.record_success()
 
-        old = {}
-        if account.get("last_data"):
-            try:
-                old = json.loads(account["last_data"])
-            except (json.JSONDecodeError, TypeError):
-                pass
+        with tracing.phase("diff"):
+            if db.snapshot_unchanged(account_id, data):
+                logger.info("  Instagram unchanged: %s", username)
+                return
+            self._diff(db, account_id, username, data)
 
-        from notifier import notify
+        db.record_check_success(account_id, data)
+        logger.info("  Instagram done: %s (%d followers, %d posts)", username, data["followers"], data["posts"])
+
+    def _diff(self, db, account_id, username, data):
+        old = db.get_last_data(account_id)
+        notify = db.notify
 
         if old:
             if old.get("followers") is not None and data["followers"] != old["followers"]:
@@ -200,6 +223,3 @@ class InstagramMonitor:
                 db.add_event(account_id, "privacy_change", summary,
                              {"old": old["is_private"], "new": data["is_private"]})
                 notify(summary, "instagram", username, "privacy_change")
-
-        db.record_check_success(account_id, data)
-        logger.info("  Instagram done: %s (%d followers, %d posts)", username, data["followers"], data["posts"])
@@ -1,150 +1,233 @@
+import asyncio
 import re
-import json
-import time
 import logging
-import requests
 from datetime import datetime
 
+import aiohttp
+
+import breaker
+import ratelimit
+import tracing
+
 logger = logging.getLogger(__name__)
 
 USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-REQUEST_DELAY = 1.0
+TIMEOUT = 10
 MAX_RETRIES = 2
 RETRY_DELAY = 3
+# Responses that mean Pinterest is throttling or blocking us, not a missing user
+CIRCUIT_STATUSES = {403, 429}
 
 
-def _retry(fn, *args, retries=MAX_RETRIES, **kwargs):
+async def _retry(fn, *args, retries=MAX_RETRIES, **kwargs):
     for attempt in range(retries + 1):
         try:
-            return fn(*args, **kwargs)
+            return await fn(*args, **kwargs)
         except Exception as e:
             if attempt == retries:
                 raise
             logger.warning("Retry %d/%d: %s", attempt + 1, retries, e)
-            time.sleep(RETRY_DELAY * (attempt + 1))
+            await asyncio.sleep(RETRY_DELAY * (attempt + 1))
+
+
+def _board_urls(domain, username, text):
+    """Board URLs linked from a profile page, in a stable (sorted) order."""
+    uname_lower = username.lower()
+    matches = set(re.findall(r'"(/[^"/]+/[^"/]+/)"', text))
+    excluded = {"_created", "_saved", "_pins", "pins", "boards"}
+    board_urls = []
+    # Set order varies with PYTHONHASHSEED; the snapshot hash must not
+    for path in sorted(matches):
+        parts = path.strip("/").split("/")
+        if len(parts) != 2:
+            continue
+        path_user, slug = parts
+        if path_user.lower() != uname_lower:
+            continue
+        if slug in excluded or slug.startswith("_"):
+            continue
+        board_url = f"https://{domain}{path}"
+        if board_url not in board_urls:
+            board_urls.append(board_url)
+    return board_urls
+
+
+def _parse_board(board_url, final_url, text):
+    if final_url.rstrip("/").endswith("pinterest.com") or "<title>Pinterest</title>" in text[:2000]:
+        return None
+
+    m = re.search(r'"pin_count":(\d+)', text)
+    pin_count = int(m.group(1)) if m else 0
+
+    name = None
+    m = re.search(r'<meta property="og:title" content="([^"]+)"', text)
+    if m:
+        name = m.group(1)
+    if not name:
+        parts = board_url.rstrip("/").split("/")
+        name = parts[-1].replace("-", " ").title() if len(parts) >= 2 else "Unknown"
+    name = name.replace("\\u002F", "/").replace("\\", "")
+
+    description = None
+    m = re.search(r'<meta property="og:description" content="([^"]*)"', text)
+    if m and m.group(1).strip():
+        description = m.group(1).strip()
+
+    parts = board_url.rstrip("/").split("/")
+    uname = parts[-2] if len(parts) >= 2 else "unknown"
+
+    return {"url": board_url, "name": name, "description": description,
+            "username": uname, "pin_count": pin_count}
+
+
+def _parse_user(username, text):
+    m = re.search(r'"full_name":"([^"]+)"', text)
+    display = m.group(1) if m and len(m.group(1)) >= 2 else username
+
+    follower_count = None
+    m = re.search(r'"follower_count":(\d+)', text)
+    if m:
+        follower_count = int(m.group(1))
+
+    pin_count = None
+    m = re.search(r'"pin_count":(\d+)', text)
+    if m:
+        pin_count = int(m.group(1))
+
+    return {"username": username, "display_name": display,
+            "followers": follower_count, "pins": pin_count}
 
 
 class PinterestMonitor:
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({"User-Agent": USER_AGENT})
+        self._session = None
+
+    @property
+    def session(self):
+        # Created lazily so it binds to the scheduler's event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={"User-Agent": USER_AGENT},
+                timeout=aiohttp.ClientTimeout(total=TIMEOUT))
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get(self, url):
+        """Fetch ``url`` and return (final url, body)."""
+        with tracing.phase("wait"):
+            await ratelimit.acquire_async("pinterest")
+        with tracing.phase("fetch"):
+            async with self.session.get(url) as resp:
+                body = await resp.read()
+                tracing.record_http(len(body))
+                resp.raise_for_status()
+                return str(resp.url), body.decode(resp.charset or "utf-8", errors="replace")
 
-    def get_user_boards(self, username):
+    async def get_user_boards(self, username):
+        """Boards from the first domain that lists any; raises if every domain failed."""
         boards = []
-        uname_lower = username.lower()
+        error = None
+        fetched = False
         for domain in ("www.pinterest.com", "tr.pinterest.com", "pinterest.com"):
             try:
-                resp = self.session.get(f"https://{domain}/{username}/", timeout=10)
-                resp.raise_for_status()
-                matches = set(re.findall(r'"(/[^"/]+/[^"/]+/)"', resp.text))
-                excluded = {"_created", "_saved", "_pins", "pins", "boards"}
-                seen_urls = set()
-                for path in matches:
-                    parts = path.strip("/").split("/")
-                    if len(parts) != 2:
-                        continue
-                    path_user, slug = parts
-                    if path_user.lower() != uname_lower:
-                        continue
-                    if slug in excluded or slug.startswith("_"):
-                        continue
-                    board_url = f"https://{domain}{path}"
-                    if board_url in seen_urls:
-                        continue
-                    seen_urls.add(board_url)
-                    info = _retry(self.get_board_info, board_url)
+                _, text = await self._get(f"https://{domain}/{username}/")
+                with tracing.phase("parse"):
+                    board_urls = _board_urls(domain, username, text)
+                # Board pages are fetched concurrently; the rate limiter still paces them
+                results = await asyncio.gather(*(_retry(self.get_board_info, url) for url in board_urls),
+                                               return_exceptions=True)
+                for info in results:
+                    if isinstance(info, Exception):
+                        raise info
                     if info:
                         boards.append(info)
-                    time.sleep(REQUEST_DELAY)
+                fetched = True
                 if boards:
                     return boards
             except Exception as e:
                 logger.error("boards error %s/%s: %s", domain, username, e)
+                error = e
+        if not fetched and error:
+            raise error
         return boards
 
-    def get_board_info(self, board_url):
-        resp = self.session.get(board_url, timeout=10)
-        resp.raise_for_status()
-        text = resp.text
-
-        if resp.url.rstrip("/").endswith("pinterest.com") or "<title>Pinterest</title>" in text[:2000]:
-            return None
-
-        m = re.search(r'"pin_count":(\d+)', text)
-        pin_count = int(m.group(1)) if m else 0
-
-        name = None
-        m = re.search(r'<meta property="og:title" content="([^"]+)"', text)
-        if m:
-            name = m.group(1)
-        if not name:
-            parts = board_url.rstrip("/").split("/")
-            name = parts[-1].replace("-", " ").title() if len(parts) >= 2 else "Unknown"
-        name = name.replace("\\u002F", "/").replace("\\", "")
-
-        description = None
-        m = re.search(r'<meta property="og:description" content="([^"]*)"', text)
-        if m and m.group(1).strip():
-            description = m.group(1).strip()
+    async def get_board_info(self, board_url):
+        final_url, text = await self._get(board_url)
+        with tracing.phase("parse"):
+            return _parse_board(board_url, final_url, text)
 
-        parts = board_url.rstrip("/").split("/")
-        uname = parts[-2] if len(parts) >= 2 else "unknown"
-
-        return {"url": board_url, "name": name, "description": description,
-                "username": uname, "pin_count": pin_count}
-
-    def get_user_info(self, username):
+    async def get_user_info(self, username):
+        """Profile stats from the first domain that answers; raises the last error if none does."""
+        error = None
         for domain in ("www.pinterest.com", "tr.pinterest.com"):
             try:
-                resp = self.session.get(f"https://{domain}/{username}/", timeout=10)
-                resp.raise_for_status()
-                text = resp.text
-                m = re.search(r'"full_name":"([^"]+)"', text)
-                display = m.group(1) if m and len(m.group(1)) >= 2 else username
-
-                follower_count = None
-                m = re.search(r'"follower_count":(\d+)', text)
-                if m:
-                    follower_count = int(m.group(1))
-
-                pin_count = None
-                m = re.search(r'"pin_count":(\d+)', text)
-                if m:
-                    pin_count = int(m.group(1))
-
-                return {"username": username, "display_name": display,
-                        "followers": follower_count, "pins": pin_count}
-            except Exception:
-                continue
-        return None
+                _, text = await self._get(f"https://{domain}/{username}/")
+                with tracing.phase("parse"):
+                    return _parse_user(username, text)
+            except Exception as e:
+                error = e
+        raise error
 
-    def check(self, account, db):
+    async def check(self, account, db):
         username = account["username"]
         account_id = account["id"]
         logger.info("Checking Pinterest: %s", username)
+        circuit = breaker.get("pinterest")
+        circuit.check()
 
-        try:
-            user_info = _retry(self.get_user_info, username)
-            boards = _retry(self.get_user_boards, username)
-        except Exception as e:
+        user_info, boards = await asyncio.gather(_retry(self.get_user_info, username),
+                                                 _retry(self.get_user_boards, username),
+                                                 return_exceptions=True)
+        errors = [r for r in (user_info, boards) if isinstance(r, Exception)]
+        blocked = [e for e in errors if getattr(e, "status", None) in CIRCUIT_STATUSES]
+        # Throttled, blocked, or nothing fetched at all: count it against Pinterest
+        if blocked or len(errors) == 2:
+            e = (blocked or errors)[0]
             logger.error("Pinterest check failed for %s: %s", username, e)
+            circuit.record_failure(e)
             db.record_check_error(account_id, str(e))
             return
+        # Reached Pinterest; this also settles a half-open probe
+        circuit.record_success()
+        if isinstance(boards, Exception):
+            # Keep the stored boards rather than recording an empty snapshot
+            logger.error("Pinterest boards failed for %s: %s", username, boards)
+            db.record_check_error(account_id, str(boards))
+            return
+        if isinstance(user_info, Exception):
+            logger.warning("Pinterest profile failed for %s: %s", username, user_info)
+            user_info = None
 
         if not boards:
             logger.warning("No boards found for %s", username)
-            db.record_check_success(account_id, {"boards": [], "user": user_info})
-            return
 
-        old = {}
-        if account.get("last_data"):
-            try:
-                old = json.loads(account["last_data"])
-            except (json.JSONDecodeError, TypeError):
-                pass
+        snapshot = {"boards": boards or [], "user": user_info}
+        with tracing.phase("diff"):
+            # Reads the stored snapshot and boards, so it runs off the event loop
+            if await db.run_blocking(self._apply, db, account_id, username, user_info, snapshot):
+                logger.info("  Pinterest unchanged: %s", username)
+                return
+
+        db.record_check_success(account_id, snapshot)
+        logger.info("  Pinterest done: %s (%d boards)", username, len(snapshot["boards"]))
+
+    def _apply(self, db, account_id, username, user_info, snapshot):
+        """Diff ``snapshot`` against the stored one; True if nothing changed."""
+        if db.snapshot_unchanged(account_id, snapshot):
+            return True
+        if snapshot["boards"]:
+            self._diff(db, account_id, username, user_info, snapshot["boards"])
+        return False
+
+    def _diff(self, db, account_id, username, user_info, boards):
+        old = db.get_last_data(account_id)
 
         # Diff user-level stats
-        from notifier import notify
+        notify = db.notify
         old_user = old.get("user") or {}
         if user_info and old_user:
             if old_user.get("followers") is not None and user_info.get("followers") is not None:
@@ -184,6 +267,3 @@ class PinterestMonitor:
                 db.add_event(account_id, "new_board", summary,
                              {"board_name": board["name"], "board_url": url, "pin_count": pins})
                 notify(summary, "pinterest", username, "new_board")
-
-        db.record_check_success(account_id, {"boards": boards, "user": user_info})
-        logger.info("  Pinterest done: %s (%d boards)", username, len(boards))
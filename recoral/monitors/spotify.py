@@ -1,9 +1,15 @@
+import asyncio
 import json
 import logging
 import time
-import requests
 from datetime import datetime
 
+import aiohttp
+
+import breaker
+import ratelimit
+import tracing
+
 logger = logging.getLogger(__name__)
 
 TOKEN_URL = "https://open.spotify.com/api/token"
@@ -11,14 +17,28 @@ USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36
 TIMEOUT = 15
 MAX_RETRIES = 2
 RETRY_DELAY = 3
+# Responses that point at the credential or the platform rather than the account
+CIRCUIT_STATUSES = {401, 403, 429}
 
 
 class SpotifyMonitor:
     def __init__(self):
-        self.session = requests.Session()
+        self._session = None
         self._tokens = {}  # per sp_dc token cache
 
-    def get_access_token(self, sp_dc):
+    @property
+    def session(self):
+        # Created lazily so it binds to the scheduler's event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=TIMEOUT))
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get_access_token(self, sp_dc):
         cached = self._tokens.get(sp_dc)
         if cached and time.time() < cached["expires"]:
             return cached["token"], cached["client_id"]
@@ -30,10 +50,8 @@ class SpotifyMonitor:
         }
         for reason in ("transport", "init"):
             try:
-                resp = self.session.get(TOKEN_URL, params={"reason": reason, "productType": "web-player"},
-                                        headers=headers, timeout=TIMEOUT)
-                resp.raise_for_status()
-                data = resp.json()
+                data = await self._get(TOKEN_URL, params={"reason": reason, "productType": "web-player"},
+                                       headers=headers)
                 token = data.get("accessToken", "")
                 if token:
                     client_id = data.get("clientId", "")
@@ -47,17 +65,27 @@ class SpotifyMonitor:
                 logger.warning("Token request failed (reason=%s): %s", reason, e)
         raise RuntimeError("Failed to obtain Spotify access token - sp_dc cookie may be expired")
 
+    async def _get(self, url, **kwargs):
+        """GET ``url`` and return the decoded JSON body."""
+        with tracing.phase("wait"):
+            await ratelimit.acquire_async("spotify")
+        with tracing.phase("fetch"):
+            async with self.session.get(url, **kwargs) as resp:
+                body = await resp.read()
+                tracing.record_http(len(body))
+                resp.raise_for_status()
+        with tracing.phase("parse"):
+            return json.loads(body)
+
     def _headers(self, token, client_id=""):
         h = {"Authorization": f"Bearer {token}", "User-Agent": USER_AGENT}
         if client_id:
             h["Client-Id"] = client_id
         return h
 
-    def get_user_info(self, token, client_id, user_id):
+    async def get_user_info(self, token, client_id, user_id):
         url = f"https://spclient.wg.spotify.com/user-profile-view/v3/profile/{user_id}?playlist_limit=0&artist_limit=0&episode_limit=0&market=from_token"
-        resp = self.session.get(url, headers=self._headers(token, client_id), timeout=TIMEOUT)
-        resp.raise_for_status()
-        d = resp.json()
+        d = await self._get(url, headers=self._headers(token, client_id))
         return {
             "display_name": d.get("name", ""),
             "followers": d.get("followers_count", 0),
@@ -65,29 +93,26 @@ class SpotifyMonitor:
             "image_url": d.get("image_url", ""),
         }
 
-    def _get_profiles(self, token, client_id, user_id, endpoint):
+    async def _get_profiles(self, token, client_id, user_id, endpoint):
         url = f"https://spclient.wg.spotify.com/user-profile-view/v3/profile/{user_id}/{endpoint}?market=from_token"
         try:
-            resp = self.session.get(url, headers=self._headers(token, client_id), timeout=TIMEOUT)
-            resp.raise_for_status()
-            profiles = resp.json().get("profiles") or []
+            data = await self._get(url, headers=self._headers(token, client_id))
+            profiles = data.get("profiles") or []
             return [{"name": p.get("name"), "uri": p.get("uri")} for p in profiles if isinstance(p, dict)]
         except Exception as e:
             logger.error("Failed to get %s for %s: %s", endpoint, user_id, e)
             return []
 
-    def get_user_followers(self, token, client_id, user_id):
-        return self._get_profiles(token, client_id, user_id, "followers")
+    async def get_user_followers(self, token, client_id, user_id):
+        return await self._get_profiles(token, client_id, user_id, "followers")
 
-    def get_user_followings(self, token, client_id, user_id):
-        return self._get_profiles(token, client_id, user_id, "following")
+    async def get_user_followings(self, token, client_id, user_id):
+        return await self._get_profiles(token, client_id, user_id, "following")
 
-    def get_public_playlists(self, token, client_id, user_id):
+    async def get_public_playlists(self, token, client_id, user_id):
         url = f"https://spclient.wg.spotify.com/user-profile-view/v3/profile/{user_id}?playlist_limit=50&artist_limit=0&episode_limit=0&market=from_token"
         try:
-            resp = self.session.get(url, headers=self._headers(token, client_id), timeout=TIMEOUT)
-            resp.raise_for_status()
-            data = resp.json()
+            data = await self._get(url, headers=self._headers(token, client_id))
             playlists = data.get("public_playlists") or []
             return [{"name": p.get("name", ""), "uri": p.get("uri", ""),
                       "followers": p.get("followers_count", 0)} for p in playlists if isinstance(p, dict)]
@@ -111,57 +136,71 @@ class SpotifyMonitor:
             sp_dc = app_config.SP_DC_COOKIE
         return sp_dc
 
-    def check(self, account, db):
+    async def check(self, account, db):
         username = account["username"]
         account_id = account["id"]
 
-        sp_dc = self._resolve_sp_dc(account)
+        # The settings lookup may poll the database, so keep it off the event loop
+        sp_dc = await db.run_blocking(self._resolve_sp_dc, account)
         if not sp_dc:
             logger.warning("No sp_dc cookie for Spotify target %s", username)
             db.record_check_error(account_id, "No sp_dc cookie configured")
             return
 
         logger.info("Checking Spotify: %s", username)
+        circuit = breaker.get("spotify", sp_dc, secret=True)
+        circuit.check()
 
         try:
-            token, client_id = self.get_access_token(sp_dc)
+            with tracing.phase("auth"):
+                token, client_id = await self.get_access_token(sp_dc)
         except Exception as e:
             logger.error("Spotify token error: %s", e)
+            circuit.record_failure(e)
             db.record_check_error(account_id, str(e))
-            from notifier import notify
-            notify(f"Spotify auth failed for @{username}: sp_dc cookie may be expired",
-                   "spotify", username, "auth_failed")
+            db.notify(f"Spotify auth failed for @{username}: sp_dc cookie may be expired",
+                      "spotify", username, "auth_failed")
             return
 
         try:
-            profile = self.get_user_info(token, client_id, username)
+            profile = await self.get_user_info(token, client_id, username)
         except Exception as e:
             logger.error("Spotify profile error for %s: %s", username, e)
+            if getattr(e, "status", None) in CIRCUIT_STATUSES:
+                circuit.record_failure(e)
             db.record_check_error(account_id, str(e))
             return
+        circuit.record_success()
 
         current = dict(profile)
-        try:
-            current["follower_list"] = self.get_user_followers(token, client_id, username)
-        except Exception:
-            pass
-        try:
-            current["following_list"] = self.get_user_followings(token, client_id, username)
-        except Exception:
-            pass
-        try:
-            current["playlists"] = self.get_public_playlists(token, client_id, username)
-        except Exception:
-            pass
+        results = await asyncio.gather(
+            self.get_user_followers(token, client_id, username),
+            self.get_user_followings(token, client_id, username),
+            self.get_public_playlists(token, client_id, username),
+            return_exceptions=True)
+        for key, result in zip(("follower_list", "following_list", "playlists"), results):
+            if not isinstance(result, Exception):
+                current[key] = result
 
-        old = {}
-        if account.get("last_data"):
-            try:
-                old = json.loads(account["last_data"])
-            except (json.JSONDecodeError, TypeError):
-                pass
+        with tracing.phase("diff"):
+            # Reads the stored snapshot, so it runs off the event loop
+            if await db.run_blocking(self._apply, db, account_id, username, current):
+                logger.info("  Spotify unchanged: %s", username)
+                return
+
+        db.record_check_success(account_id, current)
+        logger.info("  Spotify done: %s (%s followers)", username, current.get("followers", "?"))
+
+    def _apply(self, db, account_id, username, current):
+        """Diff ``current`` against the stored snapshot; True if nothing changed."""
+        if db.snapshot_unchanged(account_id, current):
+            return True
+        self._diff(db, account_id, username, current)
+        return False
 
-        from notifier import notify
+    def _diff(self, db, account_id, username, current):
+        old = db.get_last_data(account_id)
+        notify = db.notify
 
         if old:
             self._diff_counts(db, notify, account_id, username, old, current, "followers", "follower_change", "Followers")
@@ -195,9 +234,6 @@ class SpotifyMonitor:
                     db.add_event(account_id, "removed_playlist", summary, {"names": names})
                     notify(summary, "spotify", username, "removed_playlist")
 
-        db.record_check_success(account_id, current)
-        logger.info("  Spotify done: %s (%s followers)", username, current.get("followers", "?"))
-
     def _diff_counts(self, db, notify, account_id, username, old, new, key, event_type, label):
         if key in old and old[key] is not None and new.get(key) != old[key]:
             diff = new[key] - old[key]
@@ -1,115 +1,343 @@
-"""Notification system for CORAL. Sends alerts via Discord webhooks and ntfy.sh."""
+"""Notification system for CORAL. Sends alerts via Discord webhooks and ntfy.sh.
+
+Checks queue notifications in the outbox table (CheckSession.notify); a
+background Sender delivers them, so a slow webhook never holds up a check.
+"""
 import json
 import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+
+import config
+import metrics
+import ratelimit
 
 logger = logging.getLogger(__name__)
 
 TIMEOUT = 10
+LEASE = 120  # seconds a claimed batch stays with its sender before others may retry it
+
+SENDS = metrics.Counter("coral_notifications_total", "Notification sends by channel and result", ["channel", "result"])
+SEND_SECONDS = metrics.Histogram("coral_notification_send_seconds", "Notification send latency", ["channel"])
+DIGEST_SIZE = metrics.Histogram("coral_notification_digest_size", "Events per notification message", ["channel"],
+                                buckets=(1, 2, 3, 5, 10, 20, 50))
+OUTBOX = metrics.Gauge("coral_notification_outbox", "Notifications waiting in the outbox", ["status"])
+
+
+def _outbox_counts():
+    import database as db
+    return {(status,): n for status, n in db.count_notifications().items()}
+
+
+OUTBOX.set_function(_outbox_counts)
+
+# One pooled session for every send; requests sessions are safe to share for
+# plain POSTs.
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=max(config.NOTIFY_WORKERS, 1)))
+_http.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=max(config.NOTIFY_WORKERS, 1)))
 
 
 def _get_config():
     import database as db
+    settings = db.get_all_settings()
     return {
-        "discord_webhook": db.get_setting("discord_webhook", ""),
-        "ntfy_topic": db.get_setting("ntfy_topic", ""),
-        "ntfy_server": db.get_setting("ntfy_server", "https://ntfy.sh"),
-        "notifications_enabled": db.get_setting("notifications_enabled", "true"),
+        "discord_webhook": settings.get("discord_webhook", ""),
+        "ntfy_topic": settings.get("ntfy_topic", ""),
+        "ntfy_server": settings.get("ntfy_server", "https://ntfy.sh"),
+        "notifications_enabled": settings.get("notifications_enabled", "true"),
     }
 
 
-def notify(summary, platform=None, username=None, event_type=None, event_data=None):
-    """Send a notification for a detected event."""
-    cfg = _get_config()
-    if cfg["notifications_enabled"] != "true":
-        return
+class RateLimited(Exception):
+    """A destination answered 429; ``retry_after`` is how long it asked us to wait."""
+
+    def __init__(self, channel, retry_after):
+        super().__init__(f"rate limited, retry after {retry_after:g}s")
+        self.channel = channel
+        self.retry_after = retry_after
+
+
+def _retry_after(resp, default=5.0):
+    value = resp.headers.get("Retry-After")
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        try:
+            seconds = float(resp.json().get("retry_after"))  # Discord puts it in the body too
+        except Exception:
+            seconds = default
+    return min(max(seconds, 0.0), 3600.0)
+
+
+def _post(channel, url, **kwargs):
+    """POST within ``channel``'s rate budget; a 429 pauses the whole destination."""
+    ratelimit.acquire(channel)
+    resp = _http.post(url, timeout=TIMEOUT, **kwargs)
+    if resp.status_code == 429:
+        retry_after = _retry_after(resp)
+        bucket = ratelimit.get_bucket(channel)
+        if bucket:
+            bucket.pause(retry_after)
+        raise RateLimited(channel, retry_after)
+    resp.raise_for_status()
+    return resp
+
 
-    sent = False
+def _destinations(cfg):
+    """channel -> send(rows) for every configured destination."""
+    destinations = {}
     if cfg["discord_webhook"]:
-        sent = _send_discord(cfg["discord_webhook"], summary, platform, username, event_type) or sent
+        destinations["discord"] = lambda rows: _send_discord(cfg["discord_webhook"], rows)
     if cfg["ntfy_topic"]:
-        sent = _send_ntfy(cfg["ntfy_server"], cfg["ntfy_topic"], summary, platform, username) or sent
+        destinations["ntfy"] = lambda rows: _send_ntfy(cfg["ntfy_server"], cfg["ntfy_topic"], rows)
+    return destinations
+
+
+# Per-message limits: Discord allows 10 embeds and 6000 characters in total,
+# ntfy turns bodies over 4096 bytes into attachments.
+_MESSAGE_LIMITS = {"discord": (10, 5000), "ntfy": (50, 3500)}
+
+
+def _chunks(channel, rows):
+    """Split a digest's rows into as few messages as ``channel`` allows."""
+    max_items, max_size = _MESSAGE_LIMITS.get(channel, (1, 0))
+    chunk, size = [], 0
+    for row in rows:
+        n = len(row["summary"].encode("utf-8")) + 16
+        if chunk and (len(chunk) >= max_items or size + n > max_size):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(row)
+        size += n
+    if chunk:
+        yield chunk
+
+
+def _deliver(channel, send, rows):
+    """Send one message; returns None on success or the exception."""
+    started = time.perf_counter()
+    error = None
+    try:
+        send(rows)
+    except Exception as e:
+        error = e
+        logger.error("%s notification failed: %s", channel, e)
+    SEND_SECONDS.observe(time.perf_counter() - started, channel=channel)
+    SENDS.inc(channel=channel, result="failed" if error else "ok")
+    DIGEST_SIZE.observe(len(rows), channel=channel)
+    return error
+
+
+class Sender:
+    """Delivers outbox notifications from a background thread.
 
-    return sent
+    Each claimed batch is one digest, split into as few messages per
+    destination as the destination allows. Messages go out in parallel over
+    a thread pool, within each destination's rate budget. Rows that fail for
+    some destinations are retried for those only, with exponential backoff
+    (or after the Retry-After of a 429). Several processes may run a
+    sender: rows are claimed before sending.
+    """
 
+    def __init__(self, workers=None):
+        self.workers = max(1, workers or config.NOTIFY_WORKERS)
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pool = None
 
-def _send_discord(webhook_url, summary, platform=None, username=None, event_type=None):
-    platform_colors = {"instagram": 0xE1306C, "pinterest": 0xE60023, "spotify": 0x1DB954}
-    platform_emoji = {"instagram": ":camera:", "pinterest": ":pushpin:", "spotify": ":musical_note:"}
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="coral-notify")
+        self._thread = threading.Thread(target=self._run, name="coral-notifier", daemon=True)
+        self._thread.start()
 
-    color = platform_colors.get(platform, 0x6366F1)
-    emoji = platform_emoji.get(platform, ":bell:")
+    def stop(self, timeout=TIMEOUT):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._pool:
+            self._pool.shutdown(wait=False)
+            self._pool = None
 
+    def kick(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                claimed = self.flush()
+            except Exception as e:
+                logger.error("Notification sender error: %s", e)
+                claimed = 0
+            if not claimed:
+                self._wake.wait(config.NOTIFY_POLL)
+                self._wake.clear()
+
+    def flush(self):
+        """Send up to a few due digests; returns how many rows were claimed."""
+        import database as db
+        rows = db.claim_notifications(self.workers * 2, LEASE)
+        if not rows:
+            return 0
+        cfg = _get_config()
+        if cfg["notifications_enabled"] != "true":
+            db.skip_notifications([n["id"] for n in rows])
+            return len(rows)
+
+        digests = {}
+        for n in rows:
+            digests.setdefault(n["batch"], []).append(n)
+        delivered = {n["id"]: set(filter(None, n["delivered"].split(","))) for n in rows}
+        sends = []
+        for digest in digests.values():
+            for channel, send in _destinations(cfg).items():
+                todo = [n for n in digest if channel not in delivered[n["id"]]]
+                for chunk in _chunks(channel, todo):
+                    sends.append((channel, chunk, self._pool.submit(_deliver, channel, send, chunk)))
+
+        # Wait for every send before opening the transaction that records them
+        errors = {}
+        for channel, chunk, future in sends:
+            error = future.result()
+            for n in chunk:
+                if error:
+                    errors.setdefault(n["id"], []).append((channel, error))
+                else:
+                    delivered[n["id"]].add(channel)
+
+        now = time.time()
+        with db.get_db():
+            for n in rows:
+                done = ",".join(sorted(delivered[n["id"]]))
+                failures = errors.get(n["id"])
+                if not failures:
+                    db.notification_sent(n["id"], done)
+                    continue
+                limited = [e.retry_after for _, e in failures if isinstance(e, RateLimited)]
+                attempted = len(limited) < len(failures)
+                attempts = n["attempts"] + attempted
+                retry_at = None
+                if attempts < config.NOTIFY_MAX_ATTEMPTS:
+                    delay = min(config.NOTIFY_BACKOFF * 2 ** max(attempts - 1, 0), config.NOTIFY_BACKOFF_MAX)
+                    retry_at = now + max([delay * random.uniform(1, 1.25)] + limited)
+                else:
+                    logger.warning("Giving up on notification %d after %d attempts", n["id"], attempts)
+                error = "; ".join(f"{channel}: {e}" for channel, e in failures)
+                db.notification_failed(n["id"], done, error, retry_at, attempted)
+        return len(rows)
+
+
+_sender = Sender()
+
+
+def start():
+    """Start delivering queued notifications from this process."""
+    _sender.start()
+
+
+def stop():
+    _sender.stop()
+
+
+def kick():
+    """Wake the sender so newly queued notifications go out right away."""
+    _sender.kick()
+
+
+PLATFORM_COLORS = {"instagram": 0xE1306C, "pinterest": 0xE60023, "spotify": 0x1DB954}
+PLATFORM_EMOJI = {"instagram": ":camera:", "pinterest": ":pushpin:", "spotify": ":musical_note:"}
+
+
+def _discord_embed(row):
+    platform, username = row.get("platform"), row.get("username")
     embed = {
-        "color": color,
-        "description": summary,
+        "color": PLATFORM_COLORS.get(platform, 0x6366F1),
+        "description": row["summary"],
         "footer": {"text": "CORAL"},
     }
     if username:
-        title = f"{emoji} @{username}"
+        title = f"{PLATFORM_EMOJI.get(platform, ':bell:')} @{username}"
         if platform:
             title += f" ({platform})"
         embed["title"] = title
+    return embed
 
-    try:
-        resp = requests.post(
-            webhook_url,
-            json={"embeds": [embed]},
-            headers={"Content-Type": "application/json"},
-            timeout=TIMEOUT,
-        )
-        resp.raise_for_status()
-        return True
-    except Exception as e:
-        logger.error("Discord notification failed: %s", e)
-        return False
+
+def _send_discord(webhook_url, rows):
+    """One webhook message with an embed per row (at most 10)."""
+    _post(
+        "discord",
+        webhook_url,
+        json={"embeds": [_discord_embed(row) for row in rows]},
+        headers={"Content-Type": "application/json"},
+    )
 
 
-def _send_ntfy(server, topic, summary, platform=None, username=None):
-    title = "CORAL"
+def _account_title(platform, username):
     if username and platform:
-        title = f"@{username} ({platform})"
-    elif username:
-        title = f"@{username}"
+        return f"@{username} ({platform})"
+    if username:
+        return f"@{username}"
+    return "CORAL"
 
-    tags = ["coral"]
-    if platform:
-        tags.append(platform)
 
-    try:
-        resp = requests.post(
-            f"{server.rstrip('/')}/{topic}",
-            data=summary.encode("utf-8"),
-            headers={
-                "Title": title,
-                "Tags": ",".join(tags),
-                "Priority": "default",
-            },
-            timeout=TIMEOUT,
-        )
-        resp.raise_for_status()
-        return True
-    except Exception as e:
-        logger.error("ntfy notification failed: %s", e)
-        return False
+def _send_ntfy(server, topic, rows):
+    """One ntfy message; several rows become a bulleted digest."""
+    accounts = {(row.get("platform"), row.get("username")) for row in rows}
+    if len(rows) == 1:
+        title, body = _account_title(*accounts.pop()), rows[0]["summary"]
+    elif len(accounts) == 1:
+        title = f"{_account_title(*accounts.pop())}: {len(rows)} updates"
+        body = "\n".join(f"• {row['summary']}" for row in rows)
+    else:
+        title = f"CORAL: {len(rows)} updates"
+        body = "\n".join(f"• {_account_title(row.get('platform'), row.get('username'))}: {row['summary']}"
+                         for row in rows)
+
+    tags = ["coral"] + sorted({row["platform"] for row in rows if row.get("platform")})
+
+    _post(
+        "ntfy",
+        f"{server.rstrip('/')}/{topic}",
+        data=body.encode("utf-8"),
+        headers={
+            "Title": title,
+            "Tags": ",".join(tags),
+            "Priority": "default",
+        },
+    )
 
 
 def test_notification():
-    """Send a test notification to verify configuration."""
+    """Send a test notification to verify configuration.
+
+    Unlike queued notifications this sends immediately, so the settings page can report
+    whether each destination works.
+    """
     cfg = _get_config()
     results = {}
 
     if cfg["discord_webhook"]:
-        results["discord"] = _send_discord(
-            cfg["discord_webhook"], "Test notification from CORAL", "coral", "test"
-        )
+        send = lambda rows: _send_discord(cfg["discord_webhook"], rows)
+        results["discord"] = _deliver("discord", send, [
+            {"summary": "Test notification from CORAL", "platform": "coral", "username": "test"}]) is None
     else:
         results["discord"] = None
 
     if cfg["ntfy_topic"]:
-        results["ntfy"] = _send_ntfy(
-            cfg["ntfy_server"], cfg["ntfy_topic"], "Test notification from CORAL"
-        )
+        send = lambda rows: _send_ntfy(cfg["ntfy_server"], cfg["ntfy_topic"], rows)
+        results["ntfy"] = _deliver("ntfy", send, [{"summary": "Test notification from CORAL"}]) is None
     else:
         results["ntfy"] = None
 
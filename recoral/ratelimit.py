@@ -0,0 +1,115 @@
+"""Shared per-platform (and per-notification-destination) request budgets.
+
+Every outbound request a monitor makes first takes a token from its
+platform's bucket, so scheduled runs, manual checks and concurrent workers
+all draw from the same budget. Sync callers sleep on their thread, async
+monitors await the same bucket without blocking the event loop.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket refilled at ``rate`` tokens/s, holding at most ``burst``.
+
+    Callers reserve tokens up front and may drive the balance negative; the
+    returned wait is how long until their reservation is covered. Waiters are
+    therefore served in order and the long-run rate never exceeds ``rate``.
+    A waiter that gives up before its turn refunds its reservation.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens=1):
+        """Take ``tokens`` and return the seconds to wait before using them."""
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def refund(self, tokens=1):
+        """Give back a reservation that will not be used, e.g. its waiter was cancelled."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.burst, self._tokens + tokens)
+
+    def pause(self, seconds):
+        """Hold every caller off for at least ``seconds``, e.g. to honour a Retry-After."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def acquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            except BaseException:
+                self.refund(tokens)
+                raise
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            # A check timeout or shutdown cancels the sleep; without the
+            # refund its tokens would stay spent and delay every later caller
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                self.refund(tokens)
+                raise
+        return wait
+
+
+_buckets = {}
+_lock = threading.Lock()
+
+
+def get_bucket(name):
+    """Return the shared bucket for ``name``, or None if it is unlimited."""
+    with _lock:
+        if name not in _buckets:
+            rate, burst = config.RATE_LIMITS.get(name, (0, 0))
+            _buckets[name] = TokenBucket(rate, burst) if rate > 0 else None
+        return _buckets[name]
+
+
+def acquire(name, tokens=1):
+    """Block until ``name``'s budget allows another request."""
+    bucket = get_bucket(name)
+    if bucket is None:
+        return 0.0
+    wait = bucket.acquire(tokens)
+    if wait > 1:
+        logger.debug("%s rate limit: waited %.1fs", name, wait)
+    return wait
+
+
+async def acquire_async(name, tokens=1):
+    """Wait, without blocking the event loop, until ``name``'s budget allows a request."""
+    bucket = get_bucket(name)
+    if bucket is None:
+        return 0.0
+    wait = await bucket.acquire_async(tokens)
+    if wait > 1:
+        logger.debug("%s rate limit: waited %.1fs", name, wait)
+    return wait
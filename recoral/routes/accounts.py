@@ -8,11 +8,14 @@ bp = Blueprint("accounts", __name__, url_prefix="/api/accounts")
 def update_account(account_id):
     data = request.get_json() or {}
     fields = {}
-    for key in ("enabled", "display_name", "config_json"):
+    for key in ("enabled", "display_name", "config_json", "hot"):
         if key in data:
             fields[key] = data[key]
     if not fields:
         return jsonify({"success": False, "error": "Nothing to update"}), 400
+    if fields.get("hot") or fields.get("enabled"):
+        # let the dispatcher pick the account up on its next resync
+        fields["next_check_at"] = None
     if not db.update_account(account_id, **fields):
         return jsonify({"success": False, "error": "Not found"}), 404
     return jsonify({"success": True})
@@ -0,0 +1,26 @@
+import time
+from flask import Blueprint, request, jsonify
+import database as db
+
+bp = Blueprint("check_runs", __name__, url_prefix="/api/check-runs")
+
+
+@bp.route("", methods=["GET"])
+def list_check_runs():
+    limit = max(1, min(request.args.get("limit", 50, type=int), 500))
+    runs = db.get_check_runs(account_id=request.args.get("account_id", type=int),
+                             platform=request.args.get("platform"),
+                             outcome=request.args.get("outcome"),
+                             limit=limit, before=request.args.get("before", type=int))
+    return jsonify({
+        "success": True, "check_runs": runs,
+        "next_before": runs[-1]["id"] if len(runs) == limit else None,
+    })
+
+
+@bp.route("/summary", methods=["GET"])
+def summary():
+    hours = max(1, min(request.args.get("hours", 24, type=int), 24 * 30))
+    limit = max(1, min(request.args.get("limit", 20, type=int), 200))
+    accounts = db.get_check_run_summary(time.time() - hours * 3600, limit)
+    return jsonify({"success": True, "hours": hours, "accounts": accounts})
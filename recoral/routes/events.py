@@ -1,3 +1,4 @@
+import base64
 import json
 from flask import Blueprint, request, jsonify
 import database as db
@@ -5,6 +6,24 @@ import database as db
 bp = Blueprint("events", __name__, url_prefix="/api/events")
 
 
+def _encode_cursor(event):
+    raw = json.dumps([event["created_at"], event["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, event_id = json.loads(raw)
+        if not isinstance(created_at, str) or not isinstance(event_id, int):
+            raise ValueError
+        return created_at, event_id
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
 @bp.route("", methods=["GET"])
 def list_events():
     account_id = request.args.get("account_id", type=int)
@@ -12,10 +31,22 @@ def list_events():
     platform = request.args.get("platform")
     limit = min(request.args.get("limit", 100, type=int), 500)
     offset = request.args.get("offset", 0, type=int)
+    try:
+        before = _decode_cursor(request.args.get("before"))
+        after = _decode_cursor(request.args.get("after"))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if before or after:
+        offset = 0
     events = db.get_events(account_id=account_id, identity_id=identity_id,
-                           platform=platform, limit=limit, offset=offset)
+                           platform=platform, limit=limit, offset=offset,
+                           before=before, after=after)
     total = db.get_event_count(account_id=account_id, identity_id=identity_id, platform=platform)
-    return jsonify({"success": True, "events": events, "total": total})
+    return jsonify({
+        "success": True, "events": events, "total": total,
+        "next_cursor": _encode_cursor(events[-1]) if len(events) == limit else None,
+        "prev_cursor": _encode_cursor(events[0]) if events else None,
+    })
 
 
 @bp.route("/<int:event_id>", methods=["GET"])
@@ -6,10 +6,12 @@ bp = Blueprint("identities", __name__, url_prefix="/api/identities")
 
 @bp.route("", methods=["GET"])
 def list_identities():
-    identities = db.get_all_identities()
-    for ident in identities:
-        ident["latest_event"] = db.get_identity_latest_event(ident["id"])
-    return jsonify({"success": True, "identities": identities})
+    limit = request.args.get("limit", type=int)
+    offset = request.args.get("offset", 0, type=int)
+    if limit is not None:
+        limit = max(1, min(limit, 500))
+    identities = db.get_all_identities(limit=limit, offset=max(offset, 0), with_latest_event=True)
+    return jsonify({"success": True, "identities": identities, "total": db.count_identities()})
 
 
 @bp.route("", methods=["POST"])
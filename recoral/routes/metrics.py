@@ -0,0 +1,9 @@
+from flask import Blueprint, Response
+import metrics
+
+bp = Blueprint("metrics", __name__)
+
+
+@bp.route("/metrics", methods=["GET"])
+def scrape():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
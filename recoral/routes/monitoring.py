@@ -1,73 +1,95 @@
-from datetime import datetime, timezone
+import threading
+import time
+from datetime import datetime
 from pathlib import Path
 from flask import Blueprint, request, jsonify, current_app
+import config
 import database as db
 from maigret_search import MAIGRET_AVAILABLE
 
 bp = Blueprint("monitoring", __name__, url_prefix="/api")
 
+# /api/stats is polled by every open dashboard; serve repeat hits from memory
+_stats_cache = {"at": 0.0, "body": None}
+_stats_lock = threading.Lock()
+
+
+def _kick_jobs():
+    """Pick the job up right away when this process runs the scheduler."""
+    scheduler = current_app.config.get("scheduler")
+    if scheduler:
+        scheduler.kick_jobs()
+
+
+def _queue_check(kind, account_id=None):
+    job_id, created = db.enqueue_job(kind, account_id)
+    if created:
+        _kick_jobs()
+    return jsonify({"success": True, "job_id": job_id, "coalesced": not created,
+                    "message": "Check queued" if created else "Check already pending"})
+
 
 @bp.route("/check-all", methods=["POST"])
 def check_all():
-    scheduler = current_app.config.get("scheduler")
-    if not scheduler:
-        return jsonify({"success": False, "error": "Scheduler not initialized"}), 500
-    import threading
-    threading.Thread(target=scheduler.check_all, daemon=True).start()
-    return jsonify({"success": True, "message": "Check started"})
+    return _queue_check("check_all")
 
 
 @bp.route("/check/<int:account_id>", methods=["POST"])
 def check_single(account_id):
-    scheduler = current_app.config.get("scheduler")
-    if not scheduler:
-        return jsonify({"success": False, "error": "Scheduler not initialized"}), 500
-    import threading
-    threading.Thread(target=scheduler.check_single, args=(account_id,), daemon=True).start()
-    return jsonify({"success": True, "message": "Check started"})
+    if not db.get_account(account_id):
+        return jsonify({"success": False, "error": "Account not found"}), 404
+    return _queue_check("check_account", account_id)
+
+
+@bp.route("/jobs", methods=["GET"])
+def list_jobs():
+    limit = max(1, min(request.args.get("limit", 20, type=int), 200))
+    return jsonify({"success": True, "jobs": db.get_jobs(limit)})
+
+
+@bp.route("/jobs/<int:job_id>", methods=["GET"])
+def get_job(job_id):
+    job = db.get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, "job": job})
 
 
 @bp.route("/stats", methods=["GET"])
 def stats():
-    identities = db.get_all_identities()
-    total_accounts = sum(len(i["accounts"]) for i in identities)
-    events = db.get_events(limit=1000)
-    now = datetime.now(timezone.utc)
-    recent = 0
-    for e in events:
-        if e.get("created_at"):
-            try:
-                from dateutil import parser as dp
-                dt = dp.parse(e["created_at"])
-                if dt.tzinfo is None:
-                    dt = dt.replace(tzinfo=timezone.utc)
-                if (now - dt).total_seconds() < 86400:
-                    recent += 1
-            except (ValueError, TypeError):
-                pass
-
-    alerts = []
-    for i in identities:
-        for a in i["accounts"]:
-            if a.get("error_count", 0) > 0:
-                alerts.append({
-                    "account_id": a["id"],
-                    "username": a["username"],
-                    "platform": a["platform"],
-                    "identity_name": i["name"],
-                    "error": a.get("last_error", "Unknown error"),
-                    "error_count": a["error_count"],
-                })
-
-    return jsonify({
+    now = time.monotonic()
+    with _stats_lock:
+        if _stats_cache["body"] is not None and now - _stats_cache["at"] < config.STATS_CACHE_TTL:
+            return jsonify(_stats_cache["body"])
+
+    totals = db.get_stats()
+    platforms = totals.pop("platforms")
+    body = {
         "success": True,
-        "stats": {
-            "identities": len(identities),
-            "accounts": total_accounts,
-            "recent_events": recent,
-        },
-        "alerts": alerts,
-    })
+        "stats": totals,
+        "platforms": platforms,
+        # Breakers live in the checking processes, which publish them each heartbeat
+        "alerts": db.get_alert_accounts() + [dict(c, type="circuit")
+                                             for c in db.get_circuit_alerts(config.LEADER_TTL)],
+        "circuit_events": db.get_circuit_events(),
+    }
+    # Schedulers publish their status each heartbeat; a web-only process has none of its own
+    nodes = db.get_nodes(config.LEADER_TTL)
+    body["nodes"] = nodes
+    lease = db.get_lease("scheduler")
+    if lease:
+        body["leader"] = {"node": lease["holder"],
+                          "expires_in": round(lease["expires_at"] - time.time(), 1)}
+    scheduler = current_app.config.get("scheduler")
+    if scheduler:
+        body["scheduler"] = scheduler.status()
+    else:
+        leader = next((n for n in nodes if lease and n["node"] == lease["holder"]), None)
+        if leader or nodes:
+            body["scheduler"] = leader or nodes[0]
+    with _stats_lock:
+        _stats_cache.update(at=now, body=body)
+    return jsonify(body)
 
 
 @bp.route("/maigret/search", methods=["POST"])
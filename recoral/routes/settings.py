@@ -37,11 +37,12 @@ def get_settings():
 def update_settings():
     data = request.get_json() or {}
     updated = []
-    for key in ALLOWED_KEYS:
-        if key in data:
-            val = str(data[key]).strip()
-            db.set_setting(key, val)
-            updated.append(key)
+    with db.get_db():
+        for key in ALLOWED_KEYS:
+            if key in data:
+                val = str(data[key]).strip()
+                db.set_setting(key, val)
+                updated.append(key)
 
     if "instagram_session" in updated:
         new_username = str(data["instagram_session"]).strip()
@@ -61,9 +62,8 @@ def update_settings():
         try:
             new_interval = max(30, int(data["check_interval"]))
             scheduler = current_app.config.get("scheduler")
-            if scheduler and scheduler.is_running:
-                scheduler.scheduler.reschedule_job("check_all", trigger="interval", seconds=new_interval)
-                scheduler.check_interval = new_interval
+            if scheduler:
+                scheduler.set_interval(new_interval)
         except (ValueError, TypeError):
             pass
 
@@ -94,6 +94,8 @@ def ig_status():
         loader = instaloader.Instaloader()
         loader.load_session_from_file(session_username)
         # Test by fetching own profile
+        import ratelimit
+        ratelimit.acquire("instagram")
         profile = instaloader.Profile.from_username(loader.context, session_username)
         return jsonify({"success": True, "status": "valid", "username": session_username,
                         "message": f"@{session_username} — valid ({profile.followers} followers)"})
@@ -1,19 +1,137 @@
+import asyncio
+import contextvars
+import heapq
 import logging
+import os
+import random
+import socket
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import CancelledError, ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from datetime import datetime
+from uuid import uuid4
 from apscheduler.schedulers.background import BackgroundScheduler
 
+import breaker
+import config
 import database as db
+import metrics
+import notifier
+import tracing
 from monitors.pinterest import PinterestMonitor
 from monitors.instagram import InstagramMonitor
 from monitors.spotify import SpotifyMonitor
 
 logger = logging.getLogger(__name__)
 
+CHECKS = metrics.Counter("coral_checks_total", "Finished checks by outcome", ["platform", "outcome"])
+CHECK_SECONDS = metrics.Histogram("coral_check_duration_seconds", "Check duration, excluding the wait for a worker slot",
+                                  ["platform"])
+CHECK_LAG = metrics.Histogram("coral_scheduler_lag_seconds", "Delay between a scheduled check's due time and its start",
+                              ["platform"], buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600))
+QUEUE_DEPTH = metrics.Gauge("coral_scheduler_queue_depth", "Accounts waiting in this process's dispatch queue")
+IN_FLIGHT = metrics.Gauge("coral_checks_in_flight", "Checks currently running in this process")
+LEADER = metrics.Gauge("coral_scheduler_leader", "1 if this process holds the scheduler lease")
+JOBS = metrics.Gauge("coral_jobs", "Queued and running manual check jobs", ["status"])
+JOBS.set_function(lambda: {(status,): n for status, n in db.count_active_jobs().items()})
+
+
+class CheckTimeout(Exception):
+    thread = None  # for a sync monitor, the executor future still running the abandoned check
+
+
+class DurationHistogram:
+    """Check durations per platform in fixed buckets, plus each account's last one."""
+
+    BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._platforms = {}
+        self._last = {}  # account_id -> (platform, username, seconds)
+
+    def observe(self, acc, seconds):
+        with self._lock:
+            h = self._platforms.setdefault(acc["platform"], {"counts": [0] * (len(self.BUCKETS) + 1),
+                                                             "count": 0, "sum": 0.0})
+            h["counts"][bisect_left(self.BUCKETS, seconds)] += 1
+            h["count"] += 1
+            h["sum"] += seconds
+            self._last[acc["id"]] = (acc["platform"], acc["username"], seconds)
+
+    def snapshot(self, slowest=10):
+        with self._lock:
+            platforms = {
+                platform: {
+                    "buckets": dict(zip([f"le_{b:g}" for b in self.BUCKETS] + ["inf"], h["counts"])),
+                    "count": h["count"],
+                    "avg": round(h["sum"] / h["count"], 3) if h["count"] else None,
+                }
+                for platform, h in self._platforms.items()
+            }
+            top = sorted(self._last.items(), key=lambda kv: kv[1][2], reverse=True)[:slowest]
+        return {
+            "platforms": platforms,
+            "slowest": [{"account_id": account_id, "platform": p, "username": u, "seconds": round(sec, 2)}
+                        for account_id, (p, u, sec) in top],
+        }
+
+
+def adaptive_interval(recent_events, unchanged_streak, hot=False):
+    """Seconds until an account's next check, derived from how often it changes.
+
+    An account that produced events recently is checked about twice per
+    observed change; one that keeps returning the same snapshot backs off
+    geometrically. Both are clamped to the configured bounds.
+    """
+    lo, hi = config.ADAPTIVE_MIN_INTERVAL, config.ADAPTIVE_MAX_INTERVAL
+    if hot:
+        return lo
+    target = config.ADAPTIVE_WINDOW / (2 * recent_events) if recent_events else hi
+    backoff = lo * config.ADAPTIVE_BACKOFF ** min(unchanged_streak or 0, 64)
+    return int(max(lo, min(hi, target, backoff)))
+
 
 class CoralScheduler:
-    def __init__(self, check_interval=300):
+    """Runs monitor checks.
+
+    Each enabled account carries a persistent next_check_at. A dispatcher
+    job ticks every few seconds, pops the accounts that have come due from an
+    in-memory priority queue and hands them to the platform worker pools.
+    Finished checks are rescheduled one (jittered) interval later, so checks
+    stay spread out over the interval instead of arriving in one burst.
+
+    Checks run on a single asyncio event loop owned by the scheduler. Async
+    monitors (Pinterest, Spotify) run on the loop directly; sync monitors
+    (instaloader) run on their platform's thread pool. Per-platform
+    semaphores bound how many checks of each platform are in flight, and
+    database work is handed to a small pool sized like the connection pool.
+
+    When several processes share a database (gunicorn workers, extra coral
+    workers), only the holder of the "scheduler" lease dispatches scheduled
+    checks. Every process heartbeats the lease; if the leader dies its lease
+    lapses and another process takes over within LEADER_TTL seconds. Manual
+    jobs are claimed atomically, so every process may run those.
+
+    In sharded mode every process dispatches: each tick it claims the
+    accounts due before the next tick through claimed_by/lease_until and
+    only checks what it holds. The leader keeps spreading new and overdue
+    accounts so that claims stay evenly paced.
+    """
+
+    LEASE = "scheduler"
+    STOP_TIMEOUT = 10  # seconds stop() waits for cancelled checks to unwind
+
+    def __init__(self, check_interval=300, mode=None, schedule=None, sharded=None):
         self.scheduler = BackgroundScheduler()
         self.check_interval = check_interval
+        self.mode = mode or config.CHECK_MODE
+        self.schedule = schedule or config.SCHEDULE_MODE
+        self.sharded = config.SHARDED if sharded is None else sharded
         self.is_running = False
+        self.last_cycle = None
         self.pinterest = PinterestMonitor()
         self.instagram = InstagramMonitor()
         self.spotify = SpotifyMonitor()
@@ -22,45 +140,602 @@ class CoralScheduler:
             "instagram": self.instagram,
             "spotify": self.spotify,
         }
+        self._pools = {
+            platform: ThreadPoolExecutor(max_workers=max(1, config.PLATFORM_WORKERS.get(platform, 1)),
+                                         thread_name_prefix=f"coral-{platform}")
+            for platform, monitor in self._monitors.items()
+            if not asyncio.iscoroutinefunction(monitor.check)
+        }
+        self._db_pool = ThreadPoolExecutor(max_workers=config.DB_POOL_SIZE, thread_name_prefix="coral-db")
+        self._job_pool = ThreadPoolExecutor(max_workers=max(1, config.JOB_WORKERS), thread_name_prefix="coral-job")
+        self._jobs_active = 0
+        self._limits = {}     # platform -> asyncio.Semaphore, created on the loop
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="coral-loop", daemon=True)
+        self._loop_thread.start()
+        self._lock = threading.Lock()
+        self._queue = []      # heap of (due, account_id); stale entries are skipped
+        self._due = {}        # account_id -> due time of its live queue entry
+        self._in_flight = set()
+        self._platforms = {}  # account_id -> platform, for per-platform claim capacity
+        self._futures = {}    # account_id -> Future of the check in flight
+        self.durations = DurationHistogram()
+        self._synced_at = 0.0
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:6]}"
+        self.is_leader = False
+        QUEUE_DEPTH.set_function(lambda: len(self._due))
+        IN_FLIGHT.set_function(lambda: len(self._in_flight))
+        LEADER.set_function(lambda: int(self.is_leader))
 
     def start(self):
         if not self.is_running:
-            self.scheduler.add_job(self.check_all, "interval", seconds=self.check_interval,
-                                   id="check_all", replace_existing=True)
+            self.heartbeat()
+            self.scheduler.add_job(self.heartbeat, "interval", seconds=config.LEADER_HEARTBEAT,
+                                   id="heartbeat", replace_existing=True, max_instances=1)
+            self.scheduler.add_job(self.dispatch, "interval", seconds=config.DISPATCH_TICK,
+                                   id="dispatch", replace_existing=True, max_instances=1)
+            self.scheduler.add_job(self.run_jobs, "interval", seconds=config.JOB_POLL,
+                                   id="jobs", replace_existing=True, max_instances=1)
+            self.scheduler.add_job(self.prune, "interval", hours=1,
+                                   id="prune", replace_existing=True, max_instances=1)
+            self.prune()
+            notifier.start()
             self.scheduler.start()
             self.is_running = True
-            logger.info("Scheduler started (every %ds)", self.check_interval)
+            if self.schedule == "adaptive":
+                logger.info("Scheduler started (adaptive %d-%ds, %s)",
+                            config.ADAPTIVE_MIN_INTERVAL, config.ADAPTIVE_MAX_INTERVAL, self.mode)
+            else:
+                logger.info("Scheduler started (every %ds, %s)", self.check_interval, self.mode)
+
+    def prune(self):
+        """Drop finished jobs, check_runs and notifications past their retention."""
+        db.prune_jobs()
+        db.prune_check_runs(config.CHECK_RUNS_KEEP_DAYS)
+        db.prune_notifications()
+
+    def set_interval(self, seconds):
+        self.check_interval = seconds
 
     def stop(self):
         if self.is_running:
             self.scheduler.shutdown()
             self.is_running = False
-
-    def check_all(self):
-        logger.info("Running scheduled check...")
-        accounts = db.get_enabled_accounts()
-        ok = 0
-        for acc in accounts:
-            monitor = self._monitors.get(acc["platform"])
-            if not monitor:
-                continue
+            if self.is_leader:
+                db.release_lease(self.LEASE, self.node_id)
+                self.is_leader = False
+            if self.sharded:
+                db.release_claims(self.node_id)
+            db.clear_circuits(self.node_id)
+            db.remove_node(self.node_id)
+            notifier.stop()
+        if self._loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(self._drain(self.STOP_TIMEOUT),
+                                                 self._loop).result(timeout=self.STOP_TIMEOUT + 1)
+            except Exception as e:
+                logger.warning("Draining in-flight checks failed: %s", e)
             try:
-                monitor.check(acc, db)
-                ok += 1
+                asyncio.run_coroutine_threadsafe(self._close_monitors(), self._loop).result(timeout=5)
             except Exception as e:
-                logger.error("Check failed %s/%s: %s", acc["platform"], acc["username"], e)
-        logger.info("Check done: %d/%d accounts", ok, len(accounts))
+                logger.warning("Closing monitor sessions failed: %s", e)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        for pool in (*self._pools.values(), self._db_pool, self._job_pool):
+            pool.shutdown(wait=False)
 
-    def check_single(self, account_id):
-        acc = db.get_account(account_id)
-        if not acc:
+    async def _drain(self, timeout):
+        """Cancel every check in flight and wait up to ``timeout`` seconds for them to unwind.
+
+        A cancelled check discards its session but still records its run and
+        next due time, so nothing is left pending when the loop stops.
+        """
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            if pending:
+                logger.warning("%d check(s) still running at shutdown", len(pending))
+
+    async def _close_monitors(self):
+        for monitor in self._monitors.values():
+            close = getattr(monitor, "close", None)
+            if close and asyncio.iscoroutinefunction(close):
+                await close()
+
+    def status(self):
+        with self._lock:
+            queued = len(self._due)
+            next_due = min(self._due.values()) if self._due else None
+            in_flight = len(self._in_flight)
+        return {
+            "running": self.is_running,
+            "node": self.node_id,
+            "leader": self.is_leader,
+            "sharded": self.sharded,
+            "mode": self.mode,
+            "schedule": self.schedule,
+            "interval": self.check_interval,
+            "queued": queued,
+            "in_flight": in_flight,
+            "next_due_in": round(max(0.0, next_due - time.time()), 1) if next_due else None,
+            "last_cycle": self.last_cycle,
+            "durations": self.durations.snapshot(),
+        }
+
+    # -- leadership ------------------------------------------------------------
+
+    def heartbeat(self):
+        """Take or renew the scheduler lease and publish this node's status and circuit breakers."""
+        try:
+            leader = db.acquire_lease(self.LEASE, self.node_id, config.LEADER_TTL)
+        except Exception as e:
+            logger.error("Lease heartbeat failed: %s", e)
+            leader = False
+        if leader != self.is_leader:
+            logger.info("%s %s scheduler leadership", self.node_id, "acquired" if leader else "lost")
+            with self._lock:
+                # Rebuild from the database on the next dispatch after any
+                # change. A sharded queue holds this node's own claims instead.
+                if not self.sharded:
+                    self._queue, self._due = [], {}
+                self._synced_at = 0.0
+            self.is_leader = leader
+        try:
+            db.publish_node(self.node_id, self.status())
+        except Exception as e:
+            logger.error("Publishing node status failed: %s", e)
+        changes = breaker.drain()
+        try:
+            db.publish_circuits(self.node_id, breaker.alerts(), changes)
+        except Exception as e:
+            logger.error("Publishing circuit breakers failed: %s", e)
+            breaker.transitions.extendleft(reversed(changes))
+        return leader
+
+    # -- dispatching ---------------------------------------------------------
+
+    def dispatch(self):
+        now = time.time()
+        if self.sharded:
+            self._claim_due(now)
+        elif not self.is_leader:
+            return
+        elif now - self._synced_at >= config.QUEUE_RESYNC:
+            self._resync(now)
+
+        due = []
+        with self._lock:
+            while self._queue and self._queue[0][0] <= now:
+                at, account_id = heapq.heappop(self._queue)
+                if self._due.get(account_id) != at:
+                    continue
+                del self._due[account_id]
+                due.append((account_id, at))
+
+        for account_id, at in due:
+            acc = db.get_account(account_id)
+            if not acc or not acc["enabled"] or acc["platform"] not in self._monitors:
+                if self.sharded:
+                    db.release_claims(self.node_id, account_id)
+                continue
+            acc["due_at"] = at
+            if not self._claim(acc):
+                continue
+            if self.mode == "threaded":
+                self._submit(acc)
+            else:
+                self._check_account(acc, True)
+
+    def _resync(self, now):
+        """Rebuild the queue from the accounts table."""
+        self._refresh_interval()
+        rows = db.get_check_schedule()
+        with self._lock:
+            in_flight = set(self._in_flight)
+        rows = [r for r in rows if r["id"] not in in_flight]
+
+        planned = {r["id"]: r["next_check_at"] for r in rows}
+        planned.update(self._spread(rows, now))
+        with self._lock:
+            self._due = {k: v for k, v in planned.items() if k not in self._in_flight}
+            self._queue = [(at, account_id) for account_id, at in self._due.items()]
+            heapq.heapify(self._queue)
+            self._synced_at = now
+
+    def _claim_due(self, now):
+        """Claim the accounts due before the next tick and queue them locally.
+
+        A node claims no more of each platform than it has free workers for
+        (queued and in-flight checks count against them), so a saturated
+        node leaves the rest to its peers.
+        """
+        if now - self._synced_at >= config.QUEUE_RESYNC:
+            self._refresh_interval()
+            if self.is_leader:
+                self._spread(db.get_check_schedule(), now)
+            self._synced_at = now
+        with self._lock:
+            busy = Counter(self._platforms.get(a) for a in (*self._in_flight, *self._due))
+        for platform in self._monitors:
+            free = max(1, config.PLATFORM_WORKERS.get(platform, 1)) - busy[platform]
+            if free <= 0:
+                continue
+            rows = db.claim_due_accounts(self.node_id, now + config.DISPATCH_TICK,
+                                         config.CLAIM_LEASE, min(config.CLAIM_BATCH, free), platform)
+            with self._lock:
+                for r in rows:
+                    self._platforms[r["id"]] = platform
+                    self._due[r["id"]] = r["next_check_at"]
+                    heapq.heappush(self._queue, (r["next_check_at"], r["id"]))
+
+    def _refresh_interval(self):
+        # The interval may have been changed from a web process
+        try:
+            self.check_interval = max(30, int(db.get_setting("check_interval", self.check_interval)))
+        except (ValueError, TypeError):
+            pass
+
+    def _spread(self, rows, now):
+        """Persist start times for new and overdue accounts and return them.
+
+        Accounts without a next_check_at are spread evenly over one interval.
+        Accounts that fell more than a grace period behind (typically because
+        coral was not running) are spread over the catch-up window, most
+        overdue first, instead of all firing at once.
+        """
+        fresh = [r["id"] for r in rows if r["next_check_at"] is None]
+        late = sorted((r for r in rows if r["next_check_at"] is not None
+                       and r["next_check_at"] < now - config.CATCHUP_GRACE),
+                      key=lambda r: r["next_check_at"])
+        updates = []
+        for i, account_id in enumerate(fresh):
+            updates.append((account_id, now + i * self.check_interval / len(fresh)))
+        window = min(self.check_interval, config.CATCHUP_WINDOW)
+        for i, r in enumerate(late):
+            updates.append((r["id"], now + i * window / len(late)))
+        if updates:
+            db.set_next_checks(updates)
+            if late:
+                logger.info("Catching up %d overdue account(s) over %ds", len(late), window)
+        return updates
+
+    def _schedule_next(self, acc, min_delay=0.0):
+        """Queue the account's next check.
+
+        Failing accounts back off exponentially with their error_count, and a
+        check skipped by an open circuit waits at least until its probe time.
+        """
+        activity = db.get_account_activity(acc["id"], config.ADAPTIVE_WINDOW) or {}
+        interval = self._interval_for(acc, activity)
+        errors = activity.get("error_count") or 0
+        if errors:
+            interval = min(interval * 2 ** min(errors, 16), max(interval, config.ERROR_BACKOFF_MAX))
+        jitter = random.uniform(-config.SCHEDULE_JITTER, config.SCHEDULE_JITTER)
+        delay = max(interval * (1 + jitter), min_delay * (1 + abs(jitter)))
+        at = time.time() + delay
+        if self.sharded:
+            # Whichever node claims it next will run it
+            db.finish_claim(acc["id"], self.node_id, at)
+            return
+        db.set_next_checks([(acc["id"], at)])
+        with self._lock:
+            self._due[acc["id"]] = at
+            heapq.heappush(self._queue, (at, acc["id"]))
+
+    def _interval_for(self, acc, activity):
+        if self.schedule != "adaptive":
+            return self.check_interval
+        if not activity:
+            return config.ADAPTIVE_MIN_INTERVAL
+        interval = adaptive_interval(activity["recent_events"], activity["unchanged_streak"], activity["hot"])
+        if interval != acc.get("check_interval"):
+            logger.debug("%s/%s: next check in %ds", acc["platform"], acc["username"], interval)
+            db.update_account(acc["id"], check_interval=interval)
+        return interval
+
+    # -- checks ----------------------------------------------------------------
+
+    def _claim(self, acc):
+        """Mark an account as being checked; False if a check is already in flight.
+
+        In sharded mode the database claim is taken (or renewed) only once
+        the check has a worker slot, see _check, so a check queued behind
+        others can't outlive its lease.
+        """
+        with self._lock:
+            if acc["id"] in self._in_flight:
+                logger.debug("%s/%s already being checked", acc["platform"], acc["username"])
+                return False
+            self._in_flight.add(acc["id"])
+            self._platforms[acc["id"]] = acc["platform"]
+            self._due.pop(acc["id"], None)
+        return True
+
+    def _submit(self, acc):
+        """Start a claimed account's check on the event loop; returns a concurrent Future."""
+        with self._lock:
+            future = self._futures[acc["id"]] = asyncio.run_coroutine_threadsafe(self._check(acc), self._loop)
+        future.add_done_callback(lambda f: self._forget(acc["id"], f))
+        return future
+
+    def _forget(self, account_id, future):
+        with self._lock:
+            if self._futures.get(account_id) is future:
+                del self._futures[account_id]
+
+    def _start(self, acc):
+        """Start a check, or return the one already in flight for this account."""
+        if self._claim(acc):
+            return self._submit(acc)
+        with self._lock:
+            return self._futures.get(acc["id"])
+
+    def _check_account(self, acc, claimed=False):
+        """Run one check and wait for it. Must not be called from the loop thread.
+
+        If the account is already being checked, waits for that check instead.
+        """
+        if acc["platform"] not in self._monitors:
             return False
-        monitor = self._monitors.get(acc["platform"])
-        if not monitor:
+        future = self._submit(acc) if claimed else self._start(acc)
+        try:
+            return future.result() if future else False
+        except CancelledError:
             return False
+
+    def _limit(self, platform):
+        sem = self._limits.get(platform)
+        if sem is None:
+            sem = self._limits[platform] = asyncio.Semaphore(max(1, config.PLATFORM_WORKERS.get(platform, 1)))
+        return sem
+
+    async def _run_check(self, monitor, acc, session, timeout, trace=None):
+        """Run one monitor check within ``timeout`` seconds of it actually starting."""
+        if asyncio.iscoroutinefunction(monitor.check):
+            await self._with_timeout(monitor.check(acc, session), timeout, trace)
+            return
+
+        # Executor threads don't inherit context; carry the check's trace over.
+        # The clock starts once a pool thread picks the check up, not while it
+        # is queued behind another one.
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        begun = asyncio.Event()
+
+        def run():
+            loop.call_soon_threadsafe(begun.set)
+            return context.run(monitor.check, acc, session)
+
+        thread = loop.run_in_executor(self._pools[acc["platform"]], run)
+        waiter = asyncio.ensure_future(begun.wait())
+        try:
+            await asyncio.wait({thread, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        try:
+            await self._with_timeout(asyncio.shield(thread), timeout, trace)
+        except CheckTimeout as e:
+            e.thread = thread
+            raise
+
+    async def _with_timeout(self, coro, timeout, trace=None):
+        """Await ``coro``, abandoning it after ``timeout`` seconds (0 = no limit).
+
+        Time spent waiting for the platform's rate limiter (the trace's
+        "wait" phase) does not count: a queue of checks sharing a small
+        request budget is slow, not stuck.
+
+        An async monitor is cancelled outright. A sync monitor's thread cannot
+        be interrupted and runs on (callers pass it shielded), but its session
+        is never committed.
+        """
+        task = asyncio.ensure_future(coro)
+        started = time.perf_counter()
+        waited = trace.waited() if trace else 0.0
         try:
-            monitor.check(acc, db)
+            while True:
+                remaining = None
+                if timeout > 0:
+                    idle = trace.waited() - waited if trace else 0.0
+                    remaining = timeout - (time.perf_counter() - started - idle)
+                    if remaining <= 0:
+                        break
+                done, _ = await asyncio.wait({task}, timeout=remaining)
+                if done:
+                    return task.result()
+        finally:
+            if not task.done():
+                task.cancel()
+        raise CheckTimeout(f"Timed out after {timeout:g}s")
+
+    async def _check(self, acc):
+        loop = asyncio.get_running_loop()
+        min_delay = 0.0
+        started = None
+        trace = None
+        outcome, error = "cancelled", None
+        try:
+            session = db.CheckSession(self._db_pool)
+            async with self._limit(acc["platform"]):
+                if self.sharded and not await loop.run_in_executor(
+                        self._db_pool, db.claim_account, acc["id"], self.node_id, config.CLAIM_LEASE):
+                    # Another node holds it, possibly because our lease ran out while queued
+                    logger.info("Skipping %s/%s: claimed by another node", acc["platform"], acc["username"])
+                    outcome, error = "skipped", "claimed by another node"
+                    return False
+                started = time.monotonic()
+                if acc.get("due_at"):
+                    CHECK_LAG.observe(max(0.0, time.time() - acc["due_at"]), platform=acc["platform"])
+                # Each check runs in its own task, so the trace stays local to it
+                trace = tracing.CheckTrace(acc)
+                tracing.activate(trace)
+                try:
+                    await self._run_check(self._monitors[acc["platform"]], acc, session, config.CHECK_TIMEOUT, trace)
+                except CheckTimeout as e:
+                    logger.warning("Check abandoned %s/%s: %s", acc["platform"], acc["username"], e)
+                    await loop.run_in_executor(self._db_pool, db.record_check_error, acc["id"], str(e))
+                    if e.thread is not None:
+                        # The thread can't be interrupted: keep its platform slot and
+                        # the account in flight until it returns, so the abandoned
+                        # check never overlaps a new one. Its session is discarded.
+                        await asyncio.wait({e.thread})
+                    raise
+            await loop.run_in_executor(self._db_pool, contextvars.copy_context().run, session.commit)
+            outcome, error = ("error", session.error) if session.error else ("ok", None)
             return True
+        except CheckTimeout as e:
+            outcome, error = "timeout", str(e)
+            return False
+        except breaker.CircuitOpen as e:
+            logger.info("Skipping %s/%s: %s", acc["platform"], acc["username"], e)
+            outcome, error = "skipped", str(e)
+            min_delay = e.circuit.retry_in()
+            return False
         except Exception as e:
             logger.error("Check failed %s/%s: %s", acc["platform"], acc["username"], e)
+            outcome, error = "failed", str(e)
             return False
+        finally:
+            if started is not None:
+                elapsed = time.monotonic() - started
+                self.durations.observe(acc, elapsed)
+                CHECK_SECONDS.observe(elapsed, platform=acc["platform"])
+            if trace:
+                trace.finish(outcome, error)
+            CHECKS.inc(platform=acc["platform"], outcome=outcome)
+            try:
+                await loop.run_in_executor(self._db_pool, self._finish, acc, min_delay, trace)
+            finally:
+                with self._lock:
+                    self._in_flight.discard(acc["id"])
+
+    def _finish(self, acc, min_delay, trace):
+        """Store the check's trace and schedule its next run in one transaction."""
+        with db.get_db():
+            if trace and trace.outcome:
+                db.add_check_run(trace.row())
+            self._schedule_next(acc, min_delay)
+
+    def check_all(self, progress=None):
+        """Check every enabled account; ``progress(done, total)`` is called as checks finish."""
+        logger.info("Running full check...")
+        return self._run_cycle(db.get_enabled_accounts(), progress)
+
+    def _run_cycle(self, accounts, progress=None):
+        started_at = datetime.utcnow()
+        started = time.monotonic()
+        accounts = [a for a in accounts if a["platform"] in self._monitors]
+        deadline = started + config.CYCLE_TIMEOUT if config.CYCLE_TIMEOUT > 0 else None
+        ok = done = abandoned = 0
+        if self.mode == "threaded":
+            # Accounts already being checked are joined rather than re-run
+            own, futures = [], []
+            for acc in accounts:
+                if self._claim(acc):
+                    own.append(self._submit(acc))
+                    futures.append(own[-1])
+                else:
+                    with self._lock:
+                        joined = self._futures.get(acc["id"])
+                    if joined:
+                        futures.append(joined)
+            done = len(accounts) - len(futures)
+            try:
+                for future in as_completed(futures, timeout=deadline - time.monotonic() if deadline else None):
+                    try:
+                        ok += 1 if future.result() else 0
+                    except CancelledError:
+                        pass
+                    done += 1
+                    if progress:
+                        progress(done, len(accounts))
+            except FutureTimeout:
+                # Over budget: drop our unfinished checks; the dispatcher reschedules them
+                pending = [f for f in own if not f.done()]
+                for future in pending:
+                    future.cancel()
+                abandoned = len(pending)
+        else:
+            for acc in accounts:
+                if deadline and time.monotonic() >= deadline:
+                    abandoned = len(accounts) - done
+                    break
+                ok += 1 if self._check_account(acc) else 0
+                done += 1
+                if progress:
+                    progress(done, len(accounts))
+        duration = time.monotonic() - started
+        if abandoned:
+            logger.warning("Cycle budget of %ds used up; abandoned %d check(s)",
+                           config.CYCLE_TIMEOUT, abandoned)
+
+        self.last_cycle = {
+            "started_at": started_at.isoformat(),
+            "duration": round(duration, 2),
+            "interval": self.check_interval,
+            "accounts": len(accounts),
+            "ok": ok,
+            "abandoned": abandoned,
+        }
+        logger.info("Check done: %d/%d accounts in %.1fs (interval %ds)",
+                    ok, len(accounts), duration, self.check_interval)
+        if duration > self.check_interval:
+            logger.warning("Full check took %.0fs, longer than the %ds interval",
+                           duration, self.check_interval)
+        return ok
+
+    def check_single(self, account_id):
+        acc = db.get_account(account_id)
+        if not acc:
+            return False
+        return self._check_account(acc)
+
+    # -- manual jobs -----------------------------------------------------------
+
+    def kick_jobs(self):
+        """Poll for jobs now rather than at the next JOB_POLL tick."""
+        if self.is_running:
+            # Reschedules the one "jobs" runner, so claims still respect JOB_WORKERS
+            self.scheduler.modify_job("jobs", next_run_time=datetime.now())
+
+    def run_jobs(self):
+        """Claim as many queued manual check requests as there are free job workers."""
+        db.fail_stale_jobs(config.JOB_STALE)
+        with self._lock:
+            free = max(1, config.JOB_WORKERS) - self._jobs_active
+        if free <= 0:
+            return
+        for job in db.claim_jobs(free):
+            with self._lock:
+                self._jobs_active += 1
+            self._job_pool.submit(self._run_job, job)
+
+    def _run_job(self, job):
+        error = None
+        last_report = 0.0
+
+        def progress(done, total):
+            nonlocal last_report
+            # At most one progress write per second, plus the final one
+            if done == total or time.monotonic() - last_report >= 1:
+                last_report = time.monotonic()
+                db.update_job_progress(job["id"], done, total)
+
+        try:
+            if job["kind"] == "check_all":
+                self.check_all(progress)
+            elif job["kind"] == "check_account":
+                db.update_job_progress(job["id"], 0, 1)
+                if not self.check_single(job["account_id"]):
+                    error = "Check did not complete"
+                db.update_job_progress(job["id"], 1)
+            else:
+                error = f"Unknown job kind: {job['kind']}"
+        except Exception as e:
+            logger.error("Job %d (%s) failed: %s", job["id"], job["kind"], e)
+            error = str(e)
+        finally:
+            with self._lock:
+                self._jobs_active -= 1
+        db.finish_job(job["id"], error)
@@ -6,7 +6,9 @@ const App = (() => {
         searchResults: null,
         currentView: 'dashboard',
         detailId: null,
-        activityOffset: 0,
+        activityPage: 1,
+        activityCursors: [null],
+        activityNext: null,
         activityTotal: 0,
     };
 
@@ -34,7 +36,7 @@ const App = (() => {
 
         if (view === 'dashboard') loadDashboard();
         else if (view === 'identities') loadIdentities();
-        else if (view === 'activity') { state.activityOffset = 0; loadActivity(); }
+        else if (view === 'activity') { state.activityPage = 1; state.activityCursors = [null]; loadActivity(); }
         else if (view === 'settings') loadSettings();
     }
 
@@ -74,6 +76,19 @@ const App = (() => {
         const el = document.getElementById('alerts-bar');
         if (!alerts || alerts.length === 0) { el.innerHTML = ''; return; }
         el.innerHTML = alerts.map(a => {
+            if (a.type === 'circuit') {
+                const state = a.state === 'open' ? `paused, retry in ${a.retry_in}s` : 'probing';
+                return `
+                    <div class="alert-item">
+                        <div class="alert-icon">&#9888;</div>
+                        <div class="alert-body">
+                            <div class="alert-title">${platformIcon(a.platform)} ${esc(a.platform)} checks ${state}</div>
+                            <div class="alert-message">${esc(a.error || 'Too many failures')}</div>
+                        </div>
+                        <div class="alert-count">${a.failures}x</div>
+                    </div>
+                `;
+            }
             const isIgAuth = a.platform === 'instagram' && /session|expired|login|unauthorized/i.test(a.error);
             return `
                 <div class="alert-item">
@@ -184,10 +199,13 @@ const App = (() => {
 
     async function loadActivity() {
         const platform = document.getElementById('activity-platform-filter').value;
-        const url = `/api/events?limit=${PAGE_SIZE}&offset=${state.activityOffset}` +
+        const cursor = state.activityCursors[state.activityPage - 1];
+        const url = `/api/events?limit=${PAGE_SIZE}` +
+                    (cursor ? `&before=${encodeURIComponent(cursor)}` : '') +
                     (platform ? `&platform=${platform}` : '');
         const data = await api(url, { silent: true });
         state.activityTotal = data.total || 0;
+        state.activityNext = data.next_cursor || null;
         renderEventFeed('activity-feed', data.events, 'No activity recorded yet.');
         renderPagination();
     }
@@ -195,17 +213,22 @@ const App = (() => {
     function renderPagination() {
         const el = document.getElementById('activity-pagination');
         if (state.activityTotal <= PAGE_SIZE) { el.innerHTML = ''; return; }
-        const page = Math.floor(state.activityOffset / PAGE_SIZE) + 1;
+        const page = state.activityPage;
         const total = Math.ceil(state.activityTotal / PAGE_SIZE);
+        const hasNext = page < total && state.activityNext;
         el.innerHTML = `
             <button class="btn btn-ghost btn-sm" ${page <= 1 ? 'disabled' : ''} onclick="App.activityPage(${page - 1})">Prev</button>
             <span class="page-info">${page} / ${total}</span>
-            <button class="btn btn-ghost btn-sm" ${page >= total ? 'disabled' : ''} onclick="App.activityPage(${page + 1})">Next</button>
+            <button class="btn btn-ghost btn-sm" ${hasNext ? '' : 'disabled'} onclick="App.activityPage(${page + 1})">Next</button>
         `;
     }
 
     function activityPage(page) {
-        state.activityOffset = (page - 1) * PAGE_SIZE;
+        if (page > state.activityPage) {
+            if (!state.activityNext) return;
+            state.activityCursors[page - 1] = state.activityNext;
+        }
+        state.activityPage = page;
         loadActivity();
     }
 
@@ -401,13 +424,36 @@ const App = (() => {
     }
 
     async function checkAccount(accountId) {
-        toast('Check started...');
-        await api(`/api/check/${accountId}`, { method: 'POST' });
+        const data = await api(`/api/check/${accountId}`, { method: 'POST' });
+        toast(data.coalesced ? 'Check already running...' : 'Check started...');
+        watchJob(data.job_id);
     }
 
     async function checkAll() {
-        toast('Checking all accounts...');
-        await api('/api/check-all', { method: 'POST' });
+        const data = await api('/api/check-all', { method: 'POST' });
+        toast(data.coalesced ? 'Full check already running...' : 'Checking all accounts...');
+        watchJob(data.job_id);
+    }
+
+    // Poll a queued check until it finishes, reporting progress as it goes
+    async function watchJob(jobId) {
+        let last = -1;
+        for (;;) {
+            await new Promise(r => setTimeout(r, 2000));
+            let job;
+            try {
+                ({ job } = await api(`/api/jobs/${jobId}`, { silent: true }));
+            } catch (e) { return; }
+            if (job.status === 'done' || job.status === 'failed') {
+                toast(job.status === 'done' ? 'Check finished' : `Check failed: ${job.error}`, job.status === 'failed');
+                if (state.currentView === 'dashboard') loadDashboard();
+                return;
+            }
+            if (job.total > 1 && job.progress !== last) {
+                last = job.progress;
+                toast(`Checking... ${job.progress}/${job.total}`);
+            }
+        }
     }
 
     // ---- Maigret Search ----
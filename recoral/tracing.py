@@ -0,0 +1,107 @@
+"""Per-check tracing.
+
+The scheduler activates a CheckTrace around each check; monitors report
+into whichever trace is current, so helpers deep in a monitor (its HTTP
+wrapper, say) need no extra arguments. The finished trace is stored as a
+check_runs row.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+PHASES = ("auth", "wait", "fetch", "parse", "diff", "db", "notify")
+
+_current = contextvars.ContextVar("coral_trace", default=None)
+
+
+class CheckTrace:
+    """Timings and counters for one check.
+
+    Phase times are summed over every entry into the phase, so requests
+    fetched concurrently add up to more than the wall-clock duration.
+    waited() is the exception: wall-clock time with any rate-limit wait
+    pending, which the scheduler leaves out of the check's time budget.
+    """
+
+    def __init__(self, account):
+        self.account_id = account["id"]
+        self.platform = account["platform"]
+        self.started_at = time.time()
+        self.finished_at = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.http_calls = 0
+        self.bytes = 0
+        self.outcome = None
+        self.error = None
+        self._waiting = 0
+        self._waiting_since = 0.0
+        self._waited = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        if name == "wait":
+            with self._lock:
+                if not self._waiting:
+                    self._waiting_since = started
+                self._waiting += 1
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.phases[name] += now - started
+            if name == "wait":
+                with self._lock:
+                    self._waiting -= 1
+                    if not self._waiting:
+                        self._waited += now - self._waiting_since
+
+    def waited(self):
+        """Wall-clock seconds so far with at least one "wait" phase open."""
+        with self._lock:
+            if self._waiting:
+                return self._waited + time.perf_counter() - self._waiting_since
+            return self._waited
+
+    def http(self, nbytes=0):
+        self.http_calls += 1
+        self.bytes += nbytes or 0
+
+    def finish(self, outcome, error=None):
+        self.finished_at = time.time()
+        self.outcome = outcome
+        self.error = error
+
+    def row(self):
+        row = {
+            "account_id": self.account_id,
+            "platform": self.platform,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_ms": int(((self.finished_at or time.time()) - self.started_at) * 1000),
+            "outcome": self.outcome,
+            "error": self.error,
+            "http_calls": self.http_calls,
+            "bytes": self.bytes,
+        }
+        row.update({f"{name}_ms": int(seconds * 1000) for name, seconds in self.phases.items()})
+        return row
+
+
+def activate(trace):
+    """Make ``trace`` current for this thread or task."""
+    return _current.set(trace)
+
+
+def phase(name):
+    """Time a block into the current trace's ``name`` phase (a no-op outside a check)."""
+    trace = _current.get()
+    return trace.phase(name) if trace else nullcontext()
+
+
+def record_http(nbytes=0):
+    trace = _current.get()
+    if trace:
+        trace.http(nbytes)